@@ -1,53 +1,128 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select, update, func, exists, and_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple, Dict, Any
 from datetime import datetime
+import base64
+import binascii
 import uuid
 
 from core.database import get_db
 from core.schemas import AnomalyResponse
-from core.models import Anomaly, Project, User
-from core.auth import get_current_user
+from core.models import Anomaly, Project
+from core.auth import get_current_user, CurrentUser
+from core.cache import cache_get, cache_set, cache_delete_index, anomalies_key, anomalies_index_key
 
 router = APIRouter()
 
+def _owned_by(user: CurrentUser):
+    """Condition matching anomalies of projects owned by the user"""
+    return exists().where(and_(
+        Project.id == Anomaly.project_id,
+        Project.user_id == user.id
+    ))
+
+def _encode_cursor(anomaly: Dict[str, Any]) -> str:
+    """Encode the keyset position after a serialized anomaly"""
+    raw = f"{anomaly['created_at']}|{anomaly['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Decode a keyset cursor into (created_at, id)"""
+    try:
+        created_at, anomaly_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        # Serialized timestamps use a "Z" suffix for UTC
+        created_at = created_at.replace("Z", "+00:00")
+        return datetime.fromisoformat(created_at), uuid.UUID(anomaly_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
 @router.get("/", response_model=List[AnomalyResponse])
 async def get_anomalies(
+    response: Response,
     project_id: Optional[uuid.UUID] = None,
     resolved: Optional[bool] = Query(None, description="Filter by resolved status"),
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    offset: int = Query(0, ge=0, description="Deprecated, use cursor"),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get anomalies
     
-    Returns anomalies for the authenticated user's projects.
+    Returns anomalies for the authenticated user's projects, newest first.
+    When more results are available, the X-Next-Cursor response header
+    holds the cursor for the next page.
     """
-    # Build query
-    query = db.query(Anomaly).join(Project).filter(Project.user_id == current_user.id)
+    # Serve from cache if possible
+    cache_key = anomalies_key(current_user.id, project_id, resolved, cursor, offset, limit)
+    anomalies = await cache_get(cache_key)
+    if anomalies is None:
+        anomalies = await _fetch_anomalies(db, current_user, project_id, resolved, cursor, offset, limit)
+        await cache_set(cache_key, anomalies, index=anomalies_index_key(current_user.id))
+    
+    # Expose cursor for the next page
+    if len(anomalies) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(anomalies[-1])
+    
+    return anomalies
+
+async def _fetch_anomalies(
+    db: AsyncSession,
+    current_user: CurrentUser,
+    project_id: Optional[uuid.UUID],
+    resolved: Optional[bool],
+    cursor: Optional[str],
+    offset: int,
+    limit: int
+) -> List[Dict[str, Any]]:
+    """Query a page of anomalies and serialize it"""
+    # Build query (only the columns in AnomalyResponse)
+    query = select(
+        Anomaly.id,
+        Anomaly.project_id,
+        Anomaly.type,
+        Anomaly.endpoint_path,
+        Anomaly.ip,
+        Anomaly.message,
+        Anomaly.severity,
+        Anomaly.created_at,
+        Anomaly.resolved,
+        Anomaly.resolved_at
+    ).where(_owned_by(current_user))
     
     # Apply filters
     if project_id:
-        query = query.filter(Anomaly.project_id == project_id)
+        query = query.where(Anomaly.project_id == project_id)
     
     if resolved is not None:
-        query = query.filter(Anomaly.resolved == resolved)
+        query = query.where(Anomaly.resolved == resolved)
+    
+    # Apply keyset pagination (falls back to offset without a cursor)
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.where(
+            tuple_(Anomaly.created_at, Anomaly.id) < tuple_(cursor_created_at, cursor_id)
+        )
+    elif offset:
+        query = query.offset(offset)
     
-    # Apply pagination
-    query = query.order_by(Anomaly.created_at.desc()).offset(offset).limit(limit)
+    query = query.order_by(Anomaly.created_at.desc(), Anomaly.id.desc()).limit(limit)
     
     # Execute query
-    anomalies = query.all()
+    result = await db.execute(query)
     
-    return anomalies
+    return [AnomalyResponse.model_validate(row._mapping).model_dump(mode="json") for row in result]
 
 @router.get("/{anomaly_id}", response_model=AnomalyResponse)
 async def get_anomaly(
     anomaly_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get anomaly by ID
@@ -55,10 +130,11 @@ async def get_anomaly(
     Returns a specific anomaly for the authenticated user.
     """
     # Get anomaly
-    anomaly = db.query(Anomaly).join(Project).filter(
+    result = await db.execute(select(Anomaly).where(
         Anomaly.id == anomaly_id,
-        Project.user_id == current_user.id
-    ).first()
+        _owned_by(current_user)
+    ))
+    anomaly = result.scalar_one_or_none()
     
     # Check if anomaly exists
     if not anomaly:
@@ -72,19 +148,23 @@ async def get_anomaly(
 @router.post("/{anomaly_id}/resolve", response_model=AnomalyResponse)
 async def resolve_anomaly(
     anomaly_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Resolve anomaly
     
     Marks a specific anomaly as resolved.
     """
-    # Get anomaly
-    anomaly = db.query(Anomaly).join(Project).filter(
+    # Mark as resolved in a single UPDATE ... RETURNING
+    stmt = update(Anomaly).where(
         Anomaly.id == anomaly_id,
-        Project.user_id == current_user.id
-    ).first()
+        _owned_by(current_user)
+    ).values(
+        resolved=True,
+        resolved_at=func.now()
+    ).returning(*Anomaly.__table__.c).execution_options(synchronize_session=False)
+    anomaly = (await db.execute(stmt)).first()
     
     # Check if anomaly exists
     if not anomaly:
@@ -93,12 +173,10 @@ async def resolve_anomaly(
             detail="Anomaly not found"
         )
     
-    # Mark as resolved
-    anomaly.resolved = True
-    anomaly.resolved_at = datetime.utcnow()
-    
     # Commit changes
-    db.commit()
-    db.refresh(anomaly)
+    await db.commit()
     
-    return anomaly
\ No newline at end of file
+    # Invalidate cached anomaly lists
+    await cache_delete_index(anomalies_index_key(current_user.id))
+    
+    return anomaly
@@ -1,31 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import uuid
 
 from core.database import get_db
 from core.schemas import ApiDocResponse
-from core.models import ApiDoc, Project, User
-from core.auth import get_current_user
+from core.models import ApiDoc, Project
+from core.auth import get_current_user, CurrentUser
+from core.cache import cache_get, cache_set, docs_key
 
 router = APIRouter()
 
 @router.get("/projects/{project_id}", response_model=ApiDocResponse)
 async def get_api_docs(
     project_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get API documentation
     
     Returns the latest API documentation for a specific project.
     """
+    # Serve from cache if possible
+    cache_key = docs_key(current_user.id, project_id)
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    
     # Check if project exists and belongs to user
-    project = db.query(Project).filter(
+    result = await db.execute(select(Project).where(
         Project.id == project_id,
         Project.user_id == current_user.id
-    ).first()
+    ))
+    project = result.scalar_one_or_none()
     
     if not project:
         raise HTTPException(
@@ -34,9 +43,10 @@ async def get_api_docs(
         )
     
     # Get latest API documentation
-    api_doc = db.query(ApiDoc).filter(
+    result = await db.execute(select(ApiDoc).where(
         ApiDoc.project_id == project_id
-    ).order_by(ApiDoc.generated_at.desc()).first()
+    ).order_by(ApiDoc.generated_at.desc()).limit(1))
+    api_doc = result.scalar_one_or_none()
     
     if not api_doc:
         raise HTTPException(
@@ -44,13 +54,17 @@ async def get_api_docs(
             detail="API documentation not found"
         )
     
-    return api_doc
+    # Cache serialized response
+    response = ApiDocResponse.model_validate(api_doc).model_dump(mode="json")
+    await cache_set(cache_key, response)
+    
+    return response
 
 @router.post("/projects/{project_id}/generate", response_model=ApiDocResponse)
 async def generate_api_docs(
     project_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Generate API documentation
@@ -59,10 +73,11 @@ async def generate_api_docs(
     This is an asynchronous operation and will return the latest documentation.
     """
     # Check if project exists and belongs to user
-    project = db.query(Project).filter(
+    result = await db.execute(select(Project).where(
         Project.id == project_id,
         Project.user_id == current_user.id
-    ).first()
+    ))
+    project = result.scalar_one_or_none()
     
     if not project:
         raise HTTPException(
@@ -71,9 +86,10 @@ async def generate_api_docs(
         )
     
     # Get latest API documentation
-    api_doc = db.query(ApiDoc).filter(
+    result = await db.execute(select(ApiDoc).where(
         ApiDoc.project_id == project_id
-    ).order_by(ApiDoc.generated_at.desc()).first()
+    ).order_by(ApiDoc.generated_at.desc()).limit(1))
+    api_doc = result.scalar_one_or_none()
     
     if not api_doc:
         raise HTTPException(
@@ -1,20 +1,142 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy import update
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple, Any
+import orjson
 import uuid
+import os
+import zlib
 
 from core.database import get_db
 from core.schemas import ApiRequestBatch
 from core.models import ApiRequest, Project
-from core.auth import get_project_from_api_key
+from core.auth import get_project_from_api_key, ApiKeyProject
+from core.cache import increment_request_count, enqueue_detection
 
 router = APIRouter()
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
+# Batches larger than this are prepared in a worker thread
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 1000))
+
+# Largest decompressed request body accepted (guards against gzip bombs)
+MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_BYTES", 16 * 1024 * 1024))
+
+# Columns loaded by COPY (created_at is set by the database)
+COPY_COLUMNS = (
+    "id",
+    "project_id",
+    "method",
+    "path",
+    "headers",
+    "query_params",
+    "status_code",
+    "latency_ms",
+    "ip",
+    "user_agent",
+    "country_code"
+)
+
+def _inline_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve local $defs references of a JSON schema (for the OpenAPI docs)"""
+    defs = schema.pop("$defs", {})
+    
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(defs[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+    
+    return resolve(schema)
+
+def _decode_body(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """Decompress a request body sent with Content-Encoding"""
+    if not content_encoding or content_encoding == "identity":
+        return body
+    
+    if content_encoding != "gzip":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported content encoding: {content_encoding}"
+        )
+    
+    # Decompress at most MAX_BODY_BYTES
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        decoded = decompressor.decompress(body, MAX_BODY_BYTES)
+    except zlib.error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid gzip body"
+        )
+    
+    if not decompressor.eof:
+        if len(decoded) >= MAX_BODY_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Request body too large"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Truncated gzip body"
+        )
+    
+    return decoded
+
+def _dump_json(value: Optional[Any]) -> Optional[str]:
+    """Serialize a JSONB value for COPY"""
+    return orjson.dumps(value).decode() if value is not None else None
+
+def _build_records(request_batch: ApiRequestBatch, project_id: uuid.UUID) -> List[Tuple[Any, ...]]:
+    """Build COPY records for a batch of API requests"""
+    return [
+        (
+            uuid.uuid4(),
+            project_id,
+            request_data.method,
+            request_data.path,
+            _dump_json(request_data.headers),
+            _dump_json(request_data.query_params),
+            request_data.status_code,
+            request_data.latency_ms,
+            request_data.ip,
+            request_data.user_agent,
+            request_data.country_code
+        )
+        for request_data in request_batch.requests
+    ]
+
+async def bulk_insert_requests(db: AsyncSession, records: List[Tuple[Any, ...]]):
+    """Load API request records with a single COPY"""
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        ApiRequest.__tablename__,
+        records=records,
+        columns=COPY_COLUMNS
+    )
+
+@router.post(
+    "/",
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_schema(ApiRequestBatch.model_json_schema())}},
+            "description": "May be sent gzip-compressed with Content-Encoding: gzip"
+        }
+    }
+)
 async def ingest_api_requests(
-    request_batch: ApiRequestBatch,
-    project: Project = Depends(get_project_from_api_key),
-    db: Session = Depends(get_db)
+    request: Request,
+    project: ApiKeyProject = Depends(get_project_from_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Ingest a batch of API requests
@@ -22,35 +144,44 @@ async def ingest_api_requests(
     This endpoint receives batched API request logs from the SDK middleware
     and stores them in the database.
     """
-    # Create API request records
-    api_requests = []
-    for request_data in request_batch.requests:
-        api_request = ApiRequest(
-            id=uuid.uuid4(),
-            project_id=project.id,
-            method=request_data.method,
-            path=request_data.path,
-            headers=request_data.headers,
-            query_params=request_data.query_params,
-            status_code=request_data.status_code,
-            latency_ms=request_data.latency_ms,
-            ip=request_data.ip,
-            user_agent=request_data.user_agent,
-            country_code=request_data.country_code
-        )
-        api_requests.append(api_request)
+    # Validate the raw body in a single pass (no intermediate dict parse)
+    body = _decode_body(await request.body(), request.headers.get("content-encoding"))
+    try:
+        request_batch = ApiRequestBatch.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(), body=body)
     
-    # Add all requests to the database
-    db.add_all(api_requests)
+    # Build records for large batches in a worker thread to keep the
+    # event loop responsive
+    if len(request_batch.requests) > BATCH_SIZE:
+        records = await run_in_threadpool(_build_records, request_batch, project.id)
+    else:
+        records = _build_records(request_batch, project.id)
     
-    # Update project request count
-    project.request_count += len(api_requests)
+    # Load all requests with COPY (no per-row INSERT overhead)
+    if records:
+        await bulk_insert_requests(db, records)
+        await db.commit()
+    total = len(records)
     
-    # Commit changes
-    db.commit()
+    if total:
+        # Buffer project request count in Redis (flushed by a periodic job)
+        try:
+            await increment_request_count(project.id, total)
+        except RedisError:
+            # Fall back to updating the counter directly
+            await db.execute(
+                update(Project.__table__)
+                .where(Project.__table__.c.id == project.id)
+                .values(request_count=Project.__table__.c.request_count + total)
+            )
+            await db.commit()
     
-    # Trigger anomaly detection (async)
-    # This would typically be done via a background task or message queue
-    # For now, we'll just return a success response
+    # Queue anomaly detection (debounced per project, run by a worker)
+    try:
+        await enqueue_detection(project.id)
+    except RedisError:
+        # Scheduled detection still covers the project
+        pass
     
-    return {"status": "success", "message": f"Ingested {len(api_requests)} API requests"}
\ No newline at end of file
+    return {"status": "success", "message": f"Ingested {total} API requests"}
@@ -1,20 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import uuid
 
 from core.database import get_db
 from core.schemas import ProjectCreate, ProjectResponse
-from core.models import Project, User
-from core.auth import get_current_user, generate_api_key
+from core.models import Project
+from core.auth import get_current_user, generate_api_key, invalidate_api_key, CurrentUser
+from core.cache import (
+    cache_get,
+    cache_set,
+    cache_delete,
+    cache_delete_index,
+    projects_key,
+    docs_key,
+    anomalies_index_key
+)
 
 router = APIRouter()
 
 @router.post("/", response_model=ProjectResponse, status_code=status.HTTP_201_CREATED)
 async def create_project(
     project: ProjectCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new project
@@ -35,31 +45,45 @@ async def create_project(
     
     # Add project to database
     db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    await db.refresh(db_project)
+    
+    # Invalidate cached project list
+    await cache_delete(projects_key(current_user.id))
     
     return db_project
 
 @router.get("/", response_model=List[ProjectResponse])
 async def get_projects(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get all projects
     
     Returns all projects for the authenticated user.
     """
+    # Serve from cache if possible
+    cache_key = projects_key(current_user.id)
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    
     # Get projects for current user
-    projects = db.query(Project).filter(Project.user_id == current_user.id).all()
+    result = await db.execute(select(Project).where(Project.user_id == current_user.id))
+    projects = result.scalars().all()
     
-    return projects
+    # Cache serialized response
+    response = [ProjectResponse.model_validate(project).model_dump(mode="json") for project in projects]
+    await cache_set(cache_key, response)
+    
+    return response
 
 @router.get("/{project_id}", response_model=ProjectResponse)
 async def get_project(
     project_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get project by ID
@@ -67,10 +91,11 @@ async def get_project(
     Returns a specific project for the authenticated user.
     """
     # Get project
-    project = db.query(Project).filter(
+    result = await db.execute(select(Project).where(
         Project.id == project_id,
         Project.user_id == current_user.id
-    ).first()
+    ))
+    project = result.scalar_one_or_none()
     
     # Check if project exists
     if not project:
@@ -85,19 +110,23 @@ async def get_project(
 async def update_project(
     project_id: uuid.UUID,
     project_data: ProjectCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update project
     
     Updates a specific project for the authenticated user.
     """
-    # Get project
-    project = db.query(Project).filter(
+    # Update project in a single UPDATE ... RETURNING
+    stmt = update(Project).where(
         Project.id == project_id,
         Project.user_id == current_user.id
-    ).first()
+    ).values(
+        name=project_data.name,
+        description=project_data.description
+    ).returning(*Project.__table__.c).execution_options(synchronize_session=False)
+    project = (await db.execute(stmt)).first()
     
     # Check if project exists
     if not project:
@@ -106,21 +135,19 @@ async def update_project(
             detail="Project not found"
         )
     
-    # Update project
-    project.name = project_data.name
-    project.description = project_data.description
-    
     # Commit changes
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    
+    # Invalidate cached project list
+    await cache_delete(projects_key(current_user.id))
     
     return project
 
 @router.delete("/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_project(
     project_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete project
@@ -128,10 +155,11 @@ async def delete_project(
     Deletes a specific project for the authenticated user.
     """
     # Get project
-    project = db.query(Project).filter(
+    result = await db.execute(select(Project).where(
         Project.id == project_id,
         Project.user_id == current_user.id
-    ).first()
+    ))
+    project = result.scalar_one_or_none()
     
     # Check if project exists
     if not project:
@@ -141,27 +169,42 @@ async def delete_project(
         )
     
     # Delete project
-    db.delete(project)
-    db.commit()
+    await db.delete(project)
+    await db.commit()
+    
+    # Invalidate cached responses that include the project
+    await cache_delete(
+        projects_key(current_user.id),
+        docs_key(current_user.id, project_id)
+    )
+    await cache_delete_index(anomalies_index_key(current_user.id))
+    await invalidate_api_key(project.api_key)
     
     return None
 
 @router.post("/{project_id}/regenerate-key", response_model=ProjectResponse)
 async def regenerate_api_key(
     project_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Regenerate API key
     
     Regenerates the API key for a specific project.
     """
-    # Get project
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.user_id == current_user.id
-    ).first()
+    # Store a new API key in a single UPDATE ... RETURNING, reading the
+    # previous key through a self-join so its cached lookup can be dropped
+    projects = Project.__table__
+    previous = projects.alias("previous")
+    stmt = update(projects).where(
+        projects.c.id == project_id,
+        projects.c.user_id == current_user.id,
+        previous.c.id == projects.c.id
+    ).values(
+        api_key=generate_api_key()
+    ).returning(previous.c.api_key.label("previous_api_key"), *projects.c)
+    project = (await db.execute(stmt)).first()
     
     # Check if project exists
     if not project:
@@ -170,11 +213,11 @@ async def regenerate_api_key(
             detail="Project not found"
         )
     
-    # Generate new API key
-    project.api_key = generate_api_key()
-    
     # Commit changes
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    
+    # Invalidate cached project list and old API key lookup
+    await cache_delete(projects_key(current_user.id))
+    await invalidate_api_key(project.previous_api_key)
     
     return project
\ No newline at end of file
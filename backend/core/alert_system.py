@@ -1,20 +1,110 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
+import asyncio
+import functools
 import httpx
 import os
-from typing import Dict, Any, List
+import string
+from typing import Dict, Any, List, Optional
 import json
 from datetime import datetime
 
-from core.models import Anomaly, Project, AlertChannel
+from core.models import Anomaly, Project, AlertChannel, AnomalySeverity
+
+# Emoji shown in Slack alerts for each severity
+SEVERITY_EMOJI = {
+    AnomalySeverity.LOW: "🟢",
+    AnomalySeverity.MEDIUM: "🟠",
+    AnomalySeverity.HIGH: "🔴",
+    AnomalySeverity.CRITICAL: "⚠️",
+}
+
+# Email alert body
+EMAIL_TEMPLATE = string.Template("""
+        <h2>API Sentinel Security Alert</h2>
+        <p><strong>Project:</strong> $project_name</p>
+        <p><strong>Type:</strong> $anomaly_type</p>
+        <p><strong>Severity:</strong> $severity</p>
+        <p><strong>Time:</strong> $timestamp</p>
+        <p><strong>Endpoint:</strong> $endpoint</p>
+        <p><strong>IP Address:</strong> $ip</p>
+        <p><strong>Message:</strong> $message</p>
+        """)
+
+def _render_slack_message(alert_data: Dict[str, Any], severity: str, emoji: str) -> Dict[str, Any]:
+    """Build a Slack message for an alert"""
+    return {
+        "blocks": [
+            {
+                "type": "header",
+                "text": {
+                    "type": "plain_text",
+                    "text": f"API Sentinel Alert: {emoji} {alert_data['anomaly_type']}"
+                }
+            },
+            {
+                "type": "section",
+                "fields": [
+                    {
+                        "type": "mrkdwn",
+                        "text": f"*Project:*\n{alert_data['project_name']}"
+                    },
+                    {
+                        "type": "mrkdwn",
+                        "text": f"*Severity:*\n{severity}"
+                    },
+                    {
+                        "type": "mrkdwn",
+                        "text": f"*Time:*\n{alert_data['timestamp']}"
+                    },
+                    {
+                        "type": "mrkdwn",
+                        "text": f"*Endpoint:*\n{alert_data['endpoint'] or 'N/A'}"
+                    }
+                ]
+            },
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"*Message:*\n{alert_data['message']}"
+                }
+            }
+        ]
+    }
+
+# Slack message renderers specialized per severity
+SLACK_TEMPLATES = {
+    severity: functools.partial(
+        _render_slack_message,
+        severity=severity.value.upper(),
+        emoji=SEVERITY_EMOJI[severity]
+    )
+    for severity in AnomalySeverity
+}
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the HTTP client shared by all alert deliveries"""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=5.0,
+        limits=httpx.Limits(max_connections=100)
+    )
 
 class AlertSystem:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, http_client: Optional[httpx.AsyncClient] = None):
         self.db = db
+        self._owns_client = http_client is None
+        self._client = http_client or create_http_client()
         self.email_provider = os.getenv("EMAIL_PROVIDER", "resend")
         self.resend_api_key = os.getenv("RESEND_API_KEY")
         self.mailgun_api_key = os.getenv("MAILGUN_API_KEY")
         self.mailgun_domain = os.getenv("MAILGUN_DOMAIN")
     
+    async def aclose(self):
+        """Close the HTTP client if it was created by this instance"""
+        if self._owns_client:
+            await self._client.aclose()
+    
     async def send_alert(self, anomaly_id: str):
         """
         Send alert for an anomaly
@@ -22,21 +112,43 @@ class AlertSystem:
         This method sends alerts via configured channels (email, Slack, webhook)
         for a specific anomaly.
         """
-        # Get anomaly
-        anomaly = self.db.query(Anomaly).filter(Anomaly.id == anomaly_id).first()
+        # Get anomaly with its project and alert channels eagerly loaded
+        anomaly = self.db.query(Anomaly).options(
+            joinedload(Anomaly.project).selectinload(Project.alert_channels)
+        ).filter(Anomaly.id == anomaly_id).first()
         if not anomaly:
             raise ValueError(f"Anomaly with ID {anomaly_id} not found")
         
-        # Get project
-        project = self.db.query(Project).filter(Project.id == anomaly.project_id).first()
-        if not project:
+        if not anomaly.project:
             raise ValueError(f"Project with ID {anomaly.project_id} not found")
         
-        # Get alert channels for project
-        alert_channels = self.db.query(AlertChannel).filter(
-            AlertChannel.project_id == project.id,
-            AlertChannel.active == True
-        ).all()
+        return await self._deliver(anomaly)
+    
+    async def send_alerts(self, anomaly_ids: List[str]) -> Dict[str, bool]:
+        """
+        Send alerts for several anomalies
+        
+        This method loads all anomalies in one query and sends every alert
+        concurrently over the shared HTTP client. Returns the delivery
+        status per anomaly ID (False for unknown anomalies).
+        """
+        # Get anomalies with their projects and alert channels eagerly loaded
+        anomalies = self.db.query(Anomaly).options(
+            joinedload(Anomaly.project).selectinload(Project.alert_channels)
+        ).filter(Anomaly.id.in_(anomaly_ids)).all()
+        
+        # Send alerts for all anomalies concurrently
+        results = await asyncio.gather(*(self._deliver(anomaly) for anomaly in anomalies))
+        delivered = {str(anomaly.id): result for anomaly, result in zip(anomalies, results)}
+        
+        return {str(anomaly_id): delivered.get(str(anomaly_id), False) for anomaly_id in anomaly_ids}
+    
+    async def _deliver(self, anomaly: Anomaly) -> bool:
+        """Send alert for a loaded anomaly to its project's active channels"""
+        project = anomaly.project
+        
+        # Get active alert channels for project
+        alert_channels = [channel for channel in project.alert_channels if channel.active]
         
         if not alert_channels:
             return False
@@ -52,23 +164,22 @@ class AlertSystem:
             "severity": anomaly.severity
         }
         
-        # Send alerts to all channels
-        results = []
+        # Send alerts to all channels concurrently
+        senders = {
+            "email": self._send_email_alert,
+            "slack": self._send_slack_alert,
+            "webhook": self._send_webhook_alert
+        }
         
-        for channel in alert_channels:
-            if channel.type == "email":
-                result = await self._send_email_alert(channel.config, alert_data)
-                results.append(result)
-            
-            elif channel.type == "slack":
-                result = await self._send_slack_alert(channel.config, alert_data)
-                results.append(result)
-            
-            elif channel.type == "webhook":
-                result = await self._send_webhook_alert(channel.config, alert_data)
-                results.append(result)
+        coros = [
+            senders[channel.type](channel.config, alert_data)
+            for channel in alert_channels
+            if channel.type in senders
+        ]
+        
+        results = await asyncio.gather(*coros, return_exceptions=True)
         
-        return all(results)
+        return all(result is True for result in results)
     
     async def _send_email_alert(self, config: Dict[str, Any], alert_data: Dict[str, Any]):
         """Send alert via email"""
@@ -77,18 +188,18 @@ class AlertSystem:
             return False
         
         # Prepare email content
-        subject = f"API Sentinel Alert: {alert_data['severity'].upper()} - {alert_data['anomaly_type']}"
+        severity = AnomalySeverity(alert_data["severity"]).value.upper()
+        subject = f"API Sentinel Alert: {severity} - {alert_data['anomaly_type']}"
         
-        body = f"""
-        <h2>API Sentinel Security Alert</h2>
-        <p><strong>Project:</strong> {alert_data['project_name']}</p>
-        <p><strong>Type:</strong> {alert_data['anomaly_type']}</p>
-        <p><strong>Severity:</strong> {alert_data['severity'].upper()}</p>
-        <p><strong>Time:</strong> {alert_data['timestamp']}</p>
-        <p><strong>Endpoint:</strong> {alert_data['endpoint'] or 'N/A'}</p>
-        <p><strong>IP Address:</strong> {alert_data['ip'] or 'N/A'}</p>
-        <p><strong>Message:</strong> {alert_data['message']}</p>
-        """
+        body = EMAIL_TEMPLATE.substitute(
+            project_name=alert_data["project_name"],
+            anomaly_type=alert_data["anomaly_type"],
+            severity=severity,
+            timestamp=alert_data["timestamp"],
+            endpoint=alert_data["endpoint"] or "N/A",
+            ip=alert_data["ip"] or "N/A",
+            message=alert_data["message"]
+        )
         
         try:
             if self.email_provider == "resend":
@@ -104,41 +215,39 @@ class AlertSystem:
         if not self.resend_api_key:
             return False
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.resend.com/emails",
-                headers={
-                    "Authorization": f"Bearer {self.resend_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "from": "alerts@apisentinel.com",
-                    "to": to_email,
-                    "subject": subject,
-                    "html": body
-                }
-            )
-            
-            return response.status_code == 200
+        response = await self._client.post(
+            "https://api.resend.com/emails",
+            headers={
+                "Authorization": f"Bearer {self.resend_api_key}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "from": "alerts@apisentinel.com",
+                "to": to_email,
+                "subject": subject,
+                "html": body
+            }
+        )
+        
+        return response.status_code == 200
     
     async def _send_mailgun_email(self, to_email: str, subject: str, body: str):
         """Send email via Mailgun API"""
         if not self.mailgun_api_key or not self.mailgun_domain:
             return False
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"https://api.mailgun.net/v3/{self.mailgun_domain}/messages",
-                auth=("api", self.mailgun_api_key),
-                data={
-                    "from": f"API Sentinel <alerts@{self.mailgun_domain}>",
-                    "to": to_email,
-                    "subject": subject,
-                    "html": body
-                }
-            )
-            
-            return response.status_code == 200
+        response = await self._client.post(
+            f"https://api.mailgun.net/v3/{self.mailgun_domain}/messages",
+            auth=("api", self.mailgun_api_key),
+            data={
+                "from": f"API Sentinel <alerts@{self.mailgun_domain}>",
+                "to": to_email,
+                "subject": subject,
+                "html": body
+            }
+        )
+        
+        return response.status_code == 200
     
     async def _send_slack_alert(self, config: Dict[str, Any], alert_data: Dict[str, Any]):
         """Send alert via Slack webhook"""
@@ -147,62 +256,15 @@ class AlertSystem:
             return False
         
         # Prepare Slack message
-        severity_emoji = "🟢"
-        if alert_data["severity"] == "medium":
-            severity_emoji = "🟠"
-        elif alert_data["severity"] == "high":
-            severity_emoji = "🔴"
-        elif alert_data["severity"] == "critical":
-            severity_emoji = "⚠️"
-        
-        message = {
-            "blocks": [
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": f"API Sentinel Alert: {severity_emoji} {alert_data['anomaly_type']}"
-                    }
-                },
-                {
-                    "type": "section",
-                    "fields": [
-                        {
-                            "type": "mrkdwn",
-                            "text": f"*Project:*\n{alert_data['project_name']}"
-                        },
-                        {
-                            "type": "mrkdwn",
-                            "text": f"*Severity:*\n{alert_data['severity'].upper()}"
-                        },
-                        {
-                            "type": "mrkdwn",
-                            "text": f"*Time:*\n{alert_data['timestamp']}"
-                        },
-                        {
-                            "type": "mrkdwn",
-                            "text": f"*Endpoint:*\n{alert_data['endpoint'] or 'N/A'}"
-                        }
-                    ]
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"*Message:*\n{alert_data['message']}"
-                    }
-                }
-            ]
-        }
+        message = SLACK_TEMPLATES[AnomalySeverity(alert_data["severity"])](alert_data)
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    webhook_url,
-                    json=message
-                )
-                
-                return response.status_code == 200
+            response = await self._client.post(
+                webhook_url,
+                json=message
+            )
+            
+            return response.status_code == 200
         except Exception as e:
             print(f"Error sending Slack alert: {str(e)}")
             return False
@@ -214,13 +276,12 @@ class AlertSystem:
             return False
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    webhook_url,
-                    json=alert_data
-                )
-                
-                return response.status_code >= 200 and response.status_code < 300
+            response = await self._client.post(
+                webhook_url,
+                json=alert_data
+            )
+            
+            return response.status_code >= 200 and response.status_code < 300
         except Exception as e:
             print(f"Error sending webhook alert: {str(e)}")
             return False
\ No newline at end of file
@@ -1,23 +1,26 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, case
-from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, and_, or_, case, exists
+from redis.exceptions import RedisError
+from datetime import timedelta
 import uuid
 import ipaddress
 
-from core.models import ApiRequest, Anomaly, AnomalyType, AnomalySeverity, Project
+from core.models import ApiRequest, Anomaly, AnomalyType, AnomalySeverity, Project, SUSPICIOUS_COUNTRIES
+from core.cache import sync_redis_client, known_endpoints_key, KNOWN_ENDPOINTS_TTL
 
 class AnomalyDetector:
     def __init__(self, db: Session, project_id: uuid.UUID):
         self.db = db
         self.project_id = project_id
-        self.suspicious_countries = ["KP", "IR", "SY", "CU"]  # Example list
+        self.suspicious_countries = SUSPICIOUS_COUNTRIES
     
     def detect_anomalies(self):
         """
         Detect anomalies in API requests
         
         This method runs various detection algorithms to identify potential
-        security anomalies in the API traffic.
+        security anomalies in the API traffic. Time windows are computed
+        from the database clock, which also stamps request created_at.
         """
         anomalies = []
         
@@ -37,60 +40,113 @@ class AnomalyDetector:
         suspicious_location_anomalies = self._detect_suspicious_locations()
         anomalies.extend(suspicious_location_anomalies)
         
-        # Save anomalies to database
+        # Save anomalies to database in a single bulk insert
         if anomalies:
-            self.db.add_all(anomalies)
+            self.db.execute(Anomaly.__table__.insert(), anomalies)
             self.db.commit()
         
         return anomalies
     
     def _detect_new_endpoints(self):
         """Detect new endpoints that haven't been seen before"""
-        # Get recent requests (last hour)
-        recent_time = datetime.utcnow() - timedelta(hours=1)
-        recent_requests = self.db.query(ApiRequest).filter(
-            ApiRequest.project_id == self.project_id,
-            ApiRequest.created_at >= recent_time
-        ).all()
+        recent_time = func.now() - timedelta(hours=1)
+        known_key = known_endpoints_key(self.project_id)
+        
+        # Check recent endpoints against the cached set of known endpoints,
+        # falling back to the database when the set is missing
+        try:
+            if sync_redis_client.exists(known_key):
+                new_endpoints = self._new_endpoints_from_cache(known_key, recent_time)
+            else:
+                new_endpoints = self._new_endpoints_from_history(recent_time)
+                self._seed_known_endpoints(known_key)
+        except RedisError:
+            new_endpoints = self._new_endpoints_from_history(recent_time)
+        
+        # Create anomalies for new endpoints
+        anomalies = []
+        
+        for method, path in new_endpoints:
+            anomaly = {
+                "id": uuid.uuid4(),
+                "project_id": self.project_id,
+                "type": AnomalyType.NEW_ENDPOINT,
+                "endpoint_path": path,
+                "ip": None,
+                "message": f"New endpoint detected: {method} {path}",
+                "severity": AnomalySeverity.LOW
+            }
+            anomalies.append(anomaly)
         
-        # Get all unique endpoints seen before the recent period
-        known_endpoints = set()
-        old_endpoints = self.db.query(
+        return anomalies
+    
+    def _new_endpoints_from_cache(self, known_key: str, recent_time):
+        """Get recent endpoints missing from the known endpoint set, then add them"""
+        recent_endpoints = self.db.query(
             ApiRequest.method, ApiRequest.path
         ).filter(
             ApiRequest.project_id == self.project_id,
-            ApiRequest.created_at < recent_time
+            ApiRequest.created_at >= recent_time
         ).distinct().all()
         
-        for method, path in old_endpoints:
-            known_endpoints.add(f"{method}:{path}")
+        if not recent_endpoints:
+            return []
         
-        # Check for new endpoints
-        anomalies = []
-        seen_new_endpoints = set()
+        # Look up all recent endpoints in one round trip
+        pipe = sync_redis_client.pipeline(transaction=False)
+        for method, path in recent_endpoints:
+            pipe.sismember(known_key, f"{method} {path}")
+        known = pipe.execute()
         
-        for request in recent_requests:
-            endpoint_key = f"{request.method}:{request.path}"
-            
-            if endpoint_key not in known_endpoints and endpoint_key not in seen_new_endpoints:
-                seen_new_endpoints.add(endpoint_key)
-                
-                anomaly = Anomaly(
-                    id=uuid.uuid4(),
-                    project_id=self.project_id,
-                    type=AnomalyType.NEW_ENDPOINT,
-                    endpoint_path=request.path,
-                    message=f"New endpoint detected: {request.method} {request.path}",
-                    severity=AnomalySeverity.LOW
-                )
-                anomalies.append(anomaly)
+        new_endpoints = [
+            endpoint for endpoint, is_known in zip(recent_endpoints, known)
+            if not is_known
+        ]
         
-        return anomalies
+        if new_endpoints:
+            pipe = sync_redis_client.pipeline(transaction=True)
+            pipe.sadd(known_key, *(f"{method} {path}" for method, path in new_endpoints))
+            pipe.expire(known_key, KNOWN_ENDPOINTS_TTL)
+            pipe.execute()
+        
+        return new_endpoints
+    
+    def _new_endpoints_from_history(self, recent_time):
+        """Get endpoints requested since recent_time that never appeared before it"""
+        history = aliased(ApiRequest)
+        return self.db.query(
+            ApiRequest.method, ApiRequest.path
+        ).filter(
+            ApiRequest.project_id == self.project_id,
+            ApiRequest.created_at >= recent_time,
+            ~exists().where(
+                history.project_id == self.project_id,
+                history.created_at < recent_time,
+                history.method == ApiRequest.method,
+                history.path == ApiRequest.path
+            )
+        ).distinct().all()
+    
+    def _seed_known_endpoints(self, known_key: str):
+        """Populate the known endpoint set from all recorded requests"""
+        endpoints = self.db.query(
+            ApiRequest.method, ApiRequest.path
+        ).filter(
+            ApiRequest.project_id == self.project_id
+        ).distinct().all()
+        
+        if not endpoints:
+            return
+        
+        pipe = sync_redis_client.pipeline(transaction=True)
+        pipe.sadd(known_key, *(f"{method} {path}" for method, path in endpoints))
+        pipe.expire(known_key, KNOWN_ENDPOINTS_TTL)
+        pipe.execute()
     
     def _detect_rate_limit_violations(self):
         """Detect excessive requests from the same IP in a short time window"""
         # Define thresholds
-        time_window = datetime.utcnow() - timedelta(minutes=1)
+        time_window = func.now() - timedelta(minutes=1)
         request_threshold = 100  # Example: 100 requests per minute
         
         # Get IPs with request counts
@@ -111,14 +167,15 @@ class AnomalyDetector:
             if count > request_threshold * 2:
                 severity = AnomalySeverity.HIGH
             
-            anomaly = Anomaly(
-                id=uuid.uuid4(),
-                project_id=self.project_id,
-                type=AnomalyType.RATE_LIMIT,
-                ip=ip,
-                message=f"Rate limit exceeded: {count} requests in 1 minute from IP {ip}",
-                severity=severity
-            )
+            anomaly = {
+                "id": uuid.uuid4(),
+                "project_id": self.project_id,
+                "type": AnomalyType.RATE_LIMIT,
+                "endpoint_path": None,
+                "ip": ip,
+                "message": f"Rate limit exceeded: {count} requests in 1 minute from IP {ip}",
+                "severity": severity
+            }
             anomalies.append(anomaly)
         
         return anomalies
@@ -126,7 +183,7 @@ class AnomalyDetector:
     def _detect_error_spikes(self):
         """Detect spikes in error responses for endpoints"""
         # Define thresholds
-        time_window = datetime.utcnow() - timedelta(minutes=5)
+        time_window = func.now() - timedelta(minutes=5)
         error_threshold = 0.2  # 20% error rate
         min_requests = 10  # Minimum requests to consider
         
@@ -155,47 +212,46 @@ class AnomalyDetector:
                 if error_rate >= 0.5:  # 50% or more errors
                     severity = AnomalySeverity.HIGH
                 
-                anomaly = Anomaly(
-                    id=uuid.uuid4(),
-                    project_id=self.project_id,
-                    type=AnomalyType.ERROR_SPIKE,
-                    endpoint_path=path,
-                    message=f"Error spike detected: {error_count}/{total_count} requests to {method} {path} returned 5xx errors",
-                    severity=severity
-                )
+                anomaly = {
+                    "id": uuid.uuid4(),
+                    "project_id": self.project_id,
+                    "type": AnomalyType.ERROR_SPIKE,
+                    "endpoint_path": path,
+                    "ip": None,
+                    "message": f"Error spike detected: {error_count}/{total_count} requests to {method} {path} returned 5xx errors",
+                    "severity": severity
+                }
                 anomalies.append(anomaly)
         
         return anomalies
     
     def _detect_suspicious_locations(self):
         """Detect access from suspicious countries"""
-        # Get recent requests from suspicious countries
-        recent_time = datetime.utcnow() - timedelta(hours=24)
-        suspicious_requests = self.db.query(ApiRequest).filter(
+        # Get the latest request per IP from suspicious countries
+        recent_time = func.now() - timedelta(hours=24)
+        suspicious_requests = self.db.query(
+            ApiRequest.ip, ApiRequest.path, ApiRequest.country_code
+        ).filter(
             ApiRequest.project_id == self.project_id,
             ApiRequest.created_at >= recent_time,
             ApiRequest.country_code.in_(self.suspicious_countries)
+        ).distinct(ApiRequest.ip).order_by(
+            ApiRequest.ip, ApiRequest.created_at.desc()
         ).all()
         
         # Create anomalies for suspicious requests
         anomalies = []
-        seen_ips = set()
         
-        for request in suspicious_requests:
-            if request.ip in seen_ips:
-                continue
-            
-            seen_ips.add(request.ip)
-            
-            anomaly = Anomaly(
-                id=uuid.uuid4(),
-                project_id=self.project_id,
-                type=AnomalyType.SUSPICIOUS_LOCATION,
-                ip=request.ip,
-                endpoint_path=request.path,
-                message=f"Access from suspicious location: {request.country_code} (IP: {request.ip})",
-                severity=AnomalySeverity.HIGH
-            )
+        for ip, path, country_code in suspicious_requests:
+            anomaly = {
+                "id": uuid.uuid4(),
+                "project_id": self.project_id,
+                "type": AnomalyType.SUSPICIOUS_LOCATION,
+                "ip": ip,
+                "endpoint_path": path,
+                "message": f"Access from suspicious location: {country_code} (IP: {ip})",
+                "severity": AnomalySeverity.HIGH
+            }
             anomalies.append(anomaly)
         
         return anomalies
\ No newline at end of file
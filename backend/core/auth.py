@@ -1,38 +1,124 @@
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+import jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, APIKeyHeader
-from sqlalchemy.orm import Session
+from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
+from dataclasses import dataclass
+from functools import partial
+from cachetools import TTLCache
+import asyncio
+import hashlib
+import hmac
 import os
+import threading
+import time
 import uuid
 
 from core.database import get_db
 from core.models import User, Project
+from core.cache import cache_get, cache_set, cache_delete, api_key_cache_key, API_KEY_CACHE_TTL
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (argon2id with OWASP-recommended parameters; existing
+# bcrypt hashes still verify and are upgraded on the next login)
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    deprecated="auto",
+    argon2__memory_cost=19456,
+    argon2__time_cost=2,
+    argon2__parallelism=1
+)
+
+# Recent successful password verifications (hashed password -> digest of
+# the verified plaintext). Failed verifications are never cached, so wrong
+# passwords always pay the full hashing cost.
+_verify_cache = TTLCache(maxsize=10_000, ttl=60)
+_verify_cache_lock = threading.Lock()
+
+# Decoded JWT payloads keyed by token hash (raw tokens are never stored)
+_jwt_cache = TTLCache(maxsize=10_000, ttl=30)
+
+# Authenticated users keyed by email
+_user_cache = TTLCache(maxsize=5000, ttl=60)
+
+# Minimum response time for a rejected API key. This slows down key
+# guessing; accepted keys are still answered faster than rejected ones.
+API_KEY_MISS_FLOOR = float(os.getenv("API_KEY_MISS_FLOOR", 0.05))
 
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# JWT encode/decode bound to the key and algorithm once
+_encode_jwt = partial(jwt.encode, key=SECRET_KEY, algorithm=ALGORITHM)
+_decode_jwt = partial(
+    jwt.decode,
+    key=SECRET_KEY,
+    algorithms=[ALGORITHM],
+    options={"require": ["exp", "sub"]}
+)
+
 # OAuth2 scheme for JWT
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
-# API Key header scheme
-api_key_header = APIKeyHeader(name="Authorization")
+# API key bearer scheme (missing keys are rejected with our own 401)
+api_key_scheme = HTTPBearer(auto_error=False)
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Authenticated user, detached from any database session"""
+    id: uuid.UUID
+    email: str
+    full_name: Optional[str]
+    created_at: datetime
+
+@dataclass(frozen=True)
+class ApiKeyProject:
+    """Project resolved from an API key"""
+    id: uuid.UUID
+
+def verify_and_update_password(plain_password, hashed_password):
+    """Verify password, returning a new hash if the stored one is outdated"""
+    digest = hashlib.sha256(f"{hashed_password}:{plain_password}".encode()).digest()
+    
+    # Skip hashing if this password was verified recently
+    with _verify_cache_lock:
+        cached = _verify_cache.get(hashed_password)
+    if cached is not None and hmac.compare_digest(cached, digest):
+        return True, None
+    
+    verified, new_hash = pwd_context.verify_and_update(plain_password, hashed_password)
+    if verified:
+        with _verify_cache_lock:
+            _verify_cache[hashed_password] = digest
+    return verified, new_hash
 
 def verify_password(plain_password, hashed_password):
     """Verify password against hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    verified, _ = verify_and_update_password(plain_password, hashed_password)
+    return verified
 
 def get_password_hash(password):
     """Hash password"""
     return pwd_context.hash(password)
 
+async def averify_password(plain_password, hashed_password):
+    """Verify password in the thread pool, off the event loop"""
+    return await run_in_threadpool(verify_password, plain_password, hashed_password)
+
+async def averify_and_update_password(plain_password, hashed_password):
+    """Verify and rehash password in the thread pool, off the event loop"""
+    return await run_in_threadpool(verify_and_update_password, plain_password, hashed_password)
+
+async def aget_password_hash(password):
+    """Hash password in the thread pool, off the event loop"""
+    return await run_in_threadpool(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -41,23 +127,41 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = _encode_jwt(to_encode)
     return encoded_jwt
 
-def get_user_by_email(db: Session, email: str):
+async def get_user_by_email(db: AsyncSession, email: str):
     """Get user by email"""
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalar_one_or_none()
 
-def authenticate_user(db: Session, email: str, password: str):
+async def authenticate_user(db: AsyncSession, email: str, password: str):
     """Authenticate user with email and password"""
-    user = get_user_by_email(db, email)
+    user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await averify_and_update_password(password, user.hashed_password)
+    if not verified:
         return False
+    
+    # Upgrade outdated (e.g. bcrypt) hashes
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def decode_access_token(token: str) -> dict:
+    """Decode JWT access token, reusing recently decoded payloads"""
+    cache_key = hashlib.sha256(token.encode()).hexdigest()[:32]
+    payload = _jwt_cache.get(cache_key)
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+    
+    payload = _decode_jwt(token)
+    _jwt_cache[cache_key] = payload
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     """Get current user from JWT token"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -65,35 +169,72 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-    except JWTError:
+    except jwt.PyJWTError:
         raise credentials_exception
-    user = get_user_by_email(db, email=email)
-    if user is None:
+    
+    # Check cached user first
+    user = _user_cache.get(email)
+    if user is not None:
+        return user
+    
+    db_user = await get_user_by_email(db, email=email)
+    if db_user is None:
         raise credentials_exception
+    
+    user = CurrentUser(
+        id=db_user.id,
+        email=db_user.email,
+        full_name=db_user.full_name,
+        created_at=db_user.created_at
+    )
+    _user_cache[email] = user
     return user
 
-def get_project_by_api_key(db: Session, api_key: str):
+async def get_project_by_api_key(db: AsyncSession, api_key: str):
     """Get project by API key"""
-    return db.query(Project).filter(Project.api_key == api_key).first()
+    result = await db.execute(select(Project).where(Project.api_key == api_key))
+    return result.scalar_one_or_none()
 
-async def get_project_from_api_key(api_key: str = Depends(api_key_header), db: Session = Depends(get_db)):
+async def get_project_from_api_key(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(api_key_scheme),
+    db: AsyncSession = Depends(get_db)
+):
     """Get project from API key header"""
-    # Check if API key is in the format "Bearer {api_key}"
-    if api_key.startswith("Bearer "):
-        api_key = api_key[7:]
+    started = time.perf_counter()
+    invalid_api_key_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid API key",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    # API key is sent as "Authorization: Bearer {api_key}"
+    if credentials is None:
+        raise invalid_api_key_exception
+    api_key = credentials.credentials
     
-    project = get_project_by_api_key(db, api_key)
+    # Check the shared Redis lookup first (invalidated for all workers at
+    # once when a key is rotated or its project deleted)
+    cache_key = api_key_cache_key(api_key)
+    cached_id = await cache_get(cache_key)
+    if cached_id is not None:
+        return ApiKeyProject(id=uuid.UUID(cached_id))
+    
+    project = await get_project_by_api_key(db, api_key)
     if not project:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return project
+        # Pad rejections to a minimum response time to slow down key guessing
+        await asyncio.sleep(max(0.0, API_KEY_MISS_FLOOR - (time.perf_counter() - started)))
+        raise invalid_api_key_exception
+    
+    await cache_set(cache_key, str(project.id), expire=API_KEY_CACHE_TTL)
+    return ApiKeyProject(id=project.id)
+
+async def invalidate_api_key(api_key: str):
+    """Drop the cached lookup of an API key"""
+    await cache_delete(api_key_cache_key(api_key))
 
 def generate_api_key():
     """Generate a unique API key"""
@@ -0,0 +1,119 @@
+import redis
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from dotenv import load_dotenv
+from typing import Any, Optional
+import hashlib
+import json
+import os
+import uuid
+
+# Load environment variables
+load_dotenv()
+
+# Get Redis URL from environment variable
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Default expiry (seconds) for cached responses
+CACHE_TTL = int(os.getenv("CACHE_TTL", 30))
+
+# Expiry (seconds) for cached API key -> project lookups
+API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", 300))
+
+# Shared async Redis client
+redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+
+# Sync Redis client for background jobs
+sync_redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+# Set of project ids with unflushed request counts
+REQUEST_COUNTS_KEY = "proj:reqs:pending"
+
+# Expiry (seconds) for a project's known endpoint set
+KNOWN_ENDPOINTS_TTL = 7 * 24 * 3600
+
+# Stream of projects queued for anomaly detection
+DETECTION_STREAM = "detect"
+DETECTION_GROUP = "detectors"
+
+# Minimum interval (seconds) between queued detections for a project
+DETECTION_DEBOUNCE = int(os.getenv("DETECTION_DEBOUNCE", 60))
+
+# Cache keys (always scoped to the requesting user)
+def projects_key(user_id: uuid.UUID) -> str:
+    return f"cache:projects:{user_id}"
+
+def docs_key(user_id: uuid.UUID, project_id: uuid.UUID) -> str:
+    return f"cache:docs:{user_id}:{project_id}"
+
+def anomalies_key(user_id: uuid.UUID, *params: Any) -> str:
+    return f"cache:anomalies:{user_id}:" + ":".join(str(param) for param in params)
+
+def anomalies_index_key(user_id: uuid.UUID) -> str:
+    # Set of the user's cached anomaly list keys
+    return f"cache:anomalies-index:{user_id}"
+
+def request_count_key(project_id: Any) -> str:
+    return f"proj:{project_id}:reqs"
+
+def known_endpoints_key(project_id: Any) -> str:
+    return f"proj:{project_id}:endpoints"
+
+def api_key_cache_key(api_key: str) -> str:
+    # Never store raw API keys in Redis
+    return f"apikey:{hashlib.sha256(api_key.encode()).hexdigest()}"
+
+async def cache_get(key: str) -> Optional[Any]:
+    """Get a cached value, or None on a miss or Redis failure"""
+    try:
+        value = await redis_client.get(key)
+    except RedisError:
+        return None
+    return json.loads(value) if value is not None else None
+
+async def cache_set(key: str, value: Any, expire: int = CACHE_TTL, index: Optional[str] = None):
+    """Cache a JSON-serializable value, recording its key in an index set if given"""
+    try:
+        if index is None:
+            await redis_client.set(key, json.dumps(value), ex=expire)
+            return
+        
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(key, json.dumps(value), ex=expire)
+            pipe.sadd(index, key)
+            pipe.expire(index, expire)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+async def cache_delete(*keys: str):
+    """Delete cached values"""
+    try:
+        await redis_client.delete(*keys)
+    except RedisError:
+        pass
+
+async def cache_delete_index(index: str):
+    """Delete all cached values recorded in an index set, and the set itself"""
+    try:
+        keys = await redis_client.smembers(index)
+        await redis_client.delete(index, *keys)
+    except RedisError:
+        pass
+
+async def increment_request_count(project_id: uuid.UUID, amount: int):
+    """Buffer a project request count increment until the next flush"""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.incrby(request_count_key(project_id), amount)
+        pipe.sadd(REQUEST_COUNTS_KEY, str(project_id))
+        await pipe.execute()
+
+async def enqueue_detection(project_id: uuid.UUID):
+    """Queue anomaly detection for a project at most once per debounce window"""
+    if await redis_client.set(f"detect:pending:{project_id}", 1, nx=True, ex=DETECTION_DEBOUNCE):
+        await redis_client.xadd(
+            DETECTION_STREAM,
+            {"project_id": str(project_id)},
+            maxlen=10000,
+            approximate=True
+        )
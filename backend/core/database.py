@@ -1,7 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+from contextlib import contextmanager
+import orjson
 import os
 
 # Load environment variables
@@ -10,19 +14,61 @@ load_dotenv()
 # Get database URL from environment variable
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Async (asyncpg) database URL used by the API
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_url(DATABASE_URL).set(
+    drivername="postgresql+asyncpg"
+)
 
-# Create session factory
+def json_serializer(obj):
+    """Serialize JSON/JSONB column values with orjson"""
+    return orjson.dumps(obj).decode()
+
+# Create SQLAlchemy engine (background jobs; pooled per worker process)
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=int(os.getenv("JOB_DB_POOL_SIZE", 5)),
+    max_overflow=int(os.getenv("JOB_DB_MAX_OVERFLOW", 10)),
+    pool_pre_ping=True,
+    pool_recycle=300,
+    json_serializer=json_serializer,
+    json_deserializer=orjson.loads
+)
+
+# Create session factory (background jobs)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@contextmanager
+def session_scope():
+    """Provide a job session that is rolled back on error and always closed"""
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# Create async SQLAlchemy engine (API)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=int(os.getenv("DB_POOL_SIZE", 20)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 40)),
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    json_serializer=json_serializer,
+    json_deserializer=orjson.loads
+)
+
+# Create async session factory (API)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create base class for models
 Base = declarative_base()
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
+# FastAPI caches dependencies per request, so nested dependencies that also
+# depend on get_db share this session (and its pooled connection).
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -1,19 +1,157 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, distinct
+from sqlalchemy import text
+from functools import lru_cache
+import asyncio
+import hashlib
+import logging
+import math
 import uuid
-import json
 import os
-from typing import Dict, List, Any
-import openai
+import re
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from openai import AsyncOpenAI
+import orjson
+import tiktoken
 
 from core.models import ApiRequest, ApiDoc, Project
 
+logger = logging.getLogger(__name__)
+
+# GPT model used for spec generation and its token limits
+GPT_MODEL = "gpt-4-turbo"
+GPT_CONTEXT_TOKENS = 128_000
+GPT_MAX_OUTPUT_TOKENS = 4096
+
+# Tokens reserved for chat message framing
+PROMPT_OVERHEAD_TOKENS = 256
+
+# Share of the token budget filled when packing projects into one request
+BATCH_FILL_RATIO = 0.9
+
+# Rough number of spec tokens generated per token of endpoint data
+SPEC_TOKENS_PER_INPUT_TOKEN = 1.5
+
+# Conservative characters per token of JSON, used to estimate token counts
+# when the tokenizer can't be loaded
+CHARS_PER_TOKEN = 3
+
+# Endpoints seen in the last 7 days (so only recent partitions are scanned)
+# with their 5 latest samples merged server-side: distinct status codes,
+# plus query parameters and headers (excluding sensitive ones) aggregated
+# into single JSONB objects (older samples win on duplicates)
+UNIQUE_ENDPOINTS_SQL = text("""
+    WITH samples AS (
+        SELECT method, path, status_code, query_params, headers, rank
+        FROM (
+            SELECT
+                method,
+                path,
+                status_code,
+                query_params,
+                headers,
+                row_number() OVER (PARTITION BY method, path ORDER BY created_at DESC) AS rank
+            FROM api_requests
+            WHERE project_id = :project_id
+              AND created_at > now() - interval '7 days'
+        ) ranked
+        WHERE rank <= 5
+    )
+    SELECT
+        e.method,
+        e.path,
+        e.status_codes,
+        coalesce(q.query_params, '{}'::jsonb) AS query_params,
+        coalesce(h.headers, '{}'::jsonb) AS headers
+    FROM (
+        SELECT method, path, array_agg(DISTINCT status_code) AS status_codes
+        FROM samples
+        GROUP BY method, path
+    ) e
+    LEFT JOIN LATERAL (
+        SELECT jsonb_object_agg(param.key, param.value ORDER BY s.rank) AS query_params
+        FROM samples s, jsonb_each(s.query_params) AS param
+        WHERE s.method = e.method
+          AND s.path = e.path
+          AND jsonb_typeof(s.query_params) = 'object'
+    ) q ON true
+    LEFT JOIN LATERAL (
+        SELECT jsonb_object_agg(header.key, header.value ORDER BY s.rank) AS headers
+        FROM samples s, jsonb_each(s.headers) AS header
+        WHERE s.method = e.method
+          AND s.path = e.path
+          AND jsonb_typeof(s.headers) = 'object'
+          AND lower(header.key) NOT IN ('authorization', 'cookie')
+    ) h ON true
+    ORDER BY e.method, e.path
+""")
+
+SYSTEM_PROMPT = "You are an API documentation expert. Your task is to generate accurate OpenAPI 3.0 specifications based on API traffic data."
+
+# JSON object inside an optional Markdown code fence
+JSON_BLOCK_RE = re.compile(r"```(?:json)?\s*(\{.*\})\s*```", re.DOTALL)
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """Load tokenizer of the GPT model (None if it can't be loaded)"""
+    try:
+        return tiktoken.encoding_for_model(GPT_MODEL)
+    except Exception:
+        # tiktoken downloads the encoding on first use
+        logger.warning("Could not load the %s tokenizer, estimating token counts", GPT_MODEL, exc_info=True)
+        return None
+
+def _count_tokens(text: str) -> int:
+    """Count tokens of text, estimated from its length without a tokenizer"""
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+def _pack_batches(entries: List[Tuple[Project, List[Dict[str, Any]]]]) -> Iterator[List[Tuple[Project, List[Dict[str, Any]]]]]:
+    """Pack (project, endpoints) entries into batches that fit one GPT request"""
+    budget = BATCH_FILL_RATIO * min(
+        GPT_CONTEXT_TOKENS - GPT_MAX_OUTPUT_TOKENS,
+        GPT_MAX_OUTPUT_TOKENS / SPEC_TOKENS_PER_INPUT_TOKEN
+    )
+    batch = []
+    batch_tokens = 0
+    
+    # Projects of similar size end up next to each other
+    for project, endpoints in sorted(entries, key=lambda entry: len(entry[1])):
+        tokens = _count_tokens(orjson.dumps(endpoints).decode())
+        if batch and batch_tokens + tokens > budget:
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append((project, endpoints))
+        batch_tokens += tokens
+    
+    if batch:
+        yield batch
+
+def _endpoints_hash(endpoints: List[Dict[str, Any]]) -> str:
+    """
+    Fingerprint the shape of endpoints to detect unchanged traffic
+    
+    Only method, path, status codes and the names of query parameters and
+    headers are hashed; sample values change with almost every request.
+    """
+    shape = sorted(
+        (
+            endpoint["method"],
+            endpoint["path"],
+            sorted(endpoint["status_codes"]),
+            sorted(endpoint["query_params"] or ()),
+            sorted({key.lower() for key in endpoint["headers"] or ()})
+        )
+        for endpoint in endpoints
+    )
+    return hashlib.sha256(orjson.dumps(shape)).hexdigest()
+
 class OpenAPIGenerator:
     def __init__(self, db: Session, project_id: uuid.UUID):
         self.db = db
         self.project_id = project_id
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.openai_api_key
     
     def generate_openapi_spec(self):
         """
@@ -33,14 +171,30 @@ class OpenAPIGenerator:
         if not endpoints:
             return None
         
+        # Reuse the latest spec if the endpoints haven't changed since
+        endpoints_hash = _endpoints_hash(endpoints)
+        latest_doc = self.db.query(ApiDoc).filter(
+            ApiDoc.project_id == self.project_id
+        ).order_by(ApiDoc.generated_at.desc()).first()
+        
+        if latest_doc and latest_doc.endpoints_hash == endpoints_hash:
+            return latest_doc
+        
         # Generate OpenAPI spec using GPT
-        openapi_spec = self._generate_with_gpt(project.name, endpoints)
+        openapi_spec = asyncio.run(self._generate_batches([[(project, endpoints)]]))[0].get(project.id)
+        
+        # Fallback to a basic template if GPT fails, without a fingerprint so
+        # the next run tries GPT again
+        if openapi_spec is None:
+            openapi_spec = self._generate_basic_template(project.name, endpoints)
+            endpoints_hash = None
         
         # Save to database
         api_doc = ApiDoc(
             id=uuid.uuid4(),
             project_id=self.project_id,
-            json_content=openapi_spec
+            json_content=openapi_spec,
+            endpoints_hash=endpoints_hash
         )
         
         self.db.add(api_doc)
@@ -49,72 +203,103 @@ class OpenAPIGenerator:
         
         return api_doc
     
-    def _get_unique_endpoints(self):
-        """Get unique endpoints with their request/response data"""
-        # Get distinct method/path combinations
-        endpoint_pairs = self.db.query(
-            distinct(ApiRequest.method),
-            distinct(ApiRequest.path)
-        ).filter(
-            ApiRequest.project_id == self.project_id
-        ).all()
-        
-        endpoints = []
-        
-        for method, path in endpoint_pairs:
-            # Get sample requests for this endpoint
-            sample_requests = self.db.query(ApiRequest).filter(
-                ApiRequest.project_id == self.project_id,
-                ApiRequest.method == method,
-                ApiRequest.path == path
-            ).order_by(ApiRequest.created_at.desc()).limit(5).all()
-            
-            if not sample_requests:
+    @classmethod
+    def generate_openapi_specs(cls, db: Session, project_ids: List[uuid.UUID]) -> List[ApiDoc]:
+        """
+        Generate OpenAPI specifications for several projects
+        
+        Projects are packed into shared GPT requests up to the model's
+        token budget, so the number of API calls grows with the total
+        traffic data rather than with the number of projects. Projects
+        whose endpoints haven't changed since their latest spec are skipped.
+        """
+        # Get endpoint fingerprints of the latest specs
+        latest_hashes = dict(
+            db.query(ApiDoc.project_id, ApiDoc.endpoints_hash)
+            .filter(ApiDoc.project_id.in_(project_ids))
+            .distinct(ApiDoc.project_id)
+            .order_by(ApiDoc.project_id, ApiDoc.generated_at.desc())
+            .all()
+        )
+        
+        # Get endpoints of every project with changed traffic
+        entries = []
+        endpoints_hashes = {}
+        for project in db.query(Project).filter(Project.id.in_(project_ids)).all():
+            endpoints = cls(db, project.id)._get_unique_endpoints()
+            if not endpoints:
                 continue
             
-            # Extract status codes
-            status_codes = set()
-            for req in sample_requests:
-                status_codes.add(req.status_code)
-            
-            # Extract query parameters
-            query_params = {}
-            for req in sample_requests:
-                if req.query_params:
-                    for key, value in req.query_params.items():
-                        query_params[key] = value
-            
-            # Extract headers (excluding sensitive ones)
-            headers = {}
-            for req in sample_requests:
-                if req.headers:
-                    for key, value in req.headers.items():
-                        if key.lower() not in ["authorization", "cookie"]:
-                            headers[key] = value
+            endpoints_hash = _endpoints_hash(endpoints)
+            if latest_hashes.get(project.id) == endpoints_hash:
+                continue
             
-            # Create endpoint info
-            endpoint_info = {
-                "method": method,
-                "path": path,
-                "status_codes": list(status_codes),
-                "query_params": query_params,
-                "headers": headers
-            }
+            entries.append((project, endpoints))
+            endpoints_hashes[project.id] = endpoints_hash
+        
+        # Generate OpenAPI specs of all batches concurrently using GPT
+        batches = list(_pack_batches(entries))
+        batch_specs = asyncio.run(cls._generate_batches(batches))
+        
+        api_docs = []
+        
+        for batch, openapi_specs in zip(batches, batch_specs):
+            # Save to database (basic template fallbacks get no fingerprint,
+            # so the next run tries GPT again)
+            batch_docs = [
+                ApiDoc(
+                    id=uuid.uuid4(),
+                    project_id=project.id,
+                    json_content=openapi_specs.get(project.id) or cls._generate_basic_template(project.name, endpoints),
+                    endpoints_hash=endpoints_hashes[project.id] if project.id in openapi_specs else None
+                )
+                for project, endpoints in batch
+            ]
+            db.add_all(batch_docs)
+            db.commit()
             
-            endpoints.append(endpoint_info)
+            api_docs.extend(batch_docs)
+        
+        return api_docs
+    
+    def _get_unique_endpoints(self):
+        """Get unique endpoints with their request/response data"""
+        # Endpoint dicts come fully shaped from the database
+        result = self.db.execute(UNIQUE_ENDPOINTS_SQL, {"project_id": self.project_id})
+        
+        return [dict(endpoint) for endpoint in result.mappings()]
+    
+    @classmethod
+    async def _generate_batches(cls, batches: List[List[Tuple[Project, List[Dict[str, Any]]]]]) -> List[Dict[uuid.UUID, Dict[str, Any]]]:
+        """Generate OpenAPI specifications for several batches concurrently"""
+        try:
+            client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        except Exception:
+            # Callers fall back to basic templates (e.g. OPENAI_API_KEY unset)
+            logger.warning("Could not create the OpenAI client", exc_info=True)
+            return [{} for _ in batches]
         
-        return endpoints
+        async with client:
+            return await asyncio.gather(*(cls._generate_with_gpt(client, batch) for batch in batches))
     
-    def _generate_with_gpt(self, project_name: str, endpoints: List[Dict[str, Any]]):
-        """Generate OpenAPI specification using GPT"""
+    @classmethod
+    async def _generate_with_gpt(cls, client: AsyncOpenAI, batch: List[Tuple[Project, List[Dict[str, Any]]]]) -> Dict[uuid.UUID, Dict[str, Any]]:
+        """
+        Generate OpenAPI specifications for a batch of projects using GPT
+        
+        Projects whose spec GPT failed to generate are left out.
+        """
+        projects = [
+            {"id": str(project.id), "name": project.name, "endpoints": endpoints}
+            for project, endpoints in batch
+        ]
+        
         # Create prompt
         prompt = f"""
-        Based on the following API traffic data, generate a complete OpenAPI 3.0 specification in JSON format.
+        Based on the following API traffic data, generate a complete OpenAPI 3.0 specification in JSON format for each project.
         
-        Project name: {project_name}
-        
-        Endpoints:
-        {json.dumps(endpoints, indent=2)}
+        Projects:
+        {orjson.dumps(projects, option=orjson.OPT_INDENT_2).decode()}
         
         Please generate a comprehensive OpenAPI 3.0 specification that includes:
         1. Info section with title, description, and version
@@ -126,40 +311,98 @@ class OpenAPIGenerator:
            - Response schemas for different status codes
         4. Components section with reusable schemas
         
-        Return only valid JSON that conforms to the OpenAPI 3.0 specification.
+        Return only valid JSON of the form {{"specs": {{"<project id>": <OpenAPI 3.0 specification>}}}}
+        with one entry per project.
         """
         
         try:
-            # Call GPT API
-            response = openai.ChatCompletion.create(
-                model="gpt-4-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an API documentation expert. Your task is to generate accurate OpenAPI 3.0 specifications based on API traffic data."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                max_tokens=4000
+            # Size the completion budget to the prompt instead of a fixed cap
+            prompt_tokens = _count_tokens(SYSTEM_PROMPT + prompt)
+            output_limit = min(
+                GPT_MAX_OUTPUT_TOKENS,
+                GPT_CONTEXT_TOKENS - prompt_tokens - PROMPT_OVERHEAD_TOKENS
             )
+            max_tokens = min(output_limit, math.ceil(SPEC_TOKENS_PER_INPUT_TOKEN * prompt_tokens))
             
-            # Extract and parse JSON from response
-            openapi_json_str = response.choices[0].message.content.strip()
+            if max_tokens <= 0:
+                raise ValueError(f"Prompt of {prompt_tokens} tokens exceeds the {GPT_MODEL} context")
             
-            # Clean up the response to extract just the JSON
-            if "```json" in openapi_json_str:
-                openapi_json_str = openapi_json_str.split("```json")[1].split("```")[0].strip()
-            elif "```" in openapi_json_str:
-                openapi_json_str = openapi_json_str.split("```")[1].split("```")[0].strip()
+            content, finish_reason = await cls._stream_completion(client, prompt, max_tokens)
             
-            # Parse JSON
-            openapi_spec = json.loads(openapi_json_str)
+            # Retry a truncated response once with the full output budget
+            if finish_reason == "length" and max_tokens < output_limit:
+                logger.warning(
+                    "GPT response truncated at %d tokens, retrying with %d",
+                    max_tokens,
+                    output_limit
+                )
+                content, finish_reason = await cls._stream_completion(client, prompt, output_limit)
             
-            return openapi_spec
+            # Never parse partial output: split the batch instead
+            if finish_reason == "length":
+                if len(batch) > 1:
+                    logger.warning(
+                        "GPT response truncated for a batch of %d projects, splitting it",
+                        len(batch)
+                    )
+                    half = len(batch) // 2
+                    first, second = await asyncio.gather(
+                        cls._generate_with_gpt(client, batch[:half]),
+                        cls._generate_with_gpt(client, batch[half:])
+                    )
+                    return {**first, **second}
+                
+                raise ValueError(f"GPT response truncated at {output_limit} tokens")
+            
+            # Extract JSON from the response (with or without a code fence)
+            match = JSON_BLOCK_RE.search(content)
+            openapi_json_str = match.group(1) if match else content
+            
+            # Parse JSON and pick out the spec of each project
+            openapi_specs = orjson.loads(openapi_json_str)["specs"]
+            specs = {
+                project.id: spec
+                for project, _ in batch
+                if isinstance(spec := openapi_specs.get(str(project.id)), dict)
+            }
+        
+        except Exception:
+            # Callers fall back to basic templates if GPT fails
+            logger.warning("GPT spec generation failed", exc_info=True)
+            specs = {}
         
-        except Exception as e:
-            # Fallback to a basic template if GPT fails
-            return self._generate_basic_template(project_name, endpoints)
+        return specs
     
-    def _generate_basic_template(self, project_name: str, endpoints: List[Dict[str, Any]]):
+    @staticmethod
+    async def _stream_completion(client: AsyncOpenAI, prompt: str, max_tokens: int) -> Tuple[str, Optional[str]]:
+        """Call GPT API, streaming the response, and return its content and finish reason"""
+        stream = await client.chat.completions.create(
+            model=GPT_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            seed=42,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        
+        chunks = []
+        finish_reason = None
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                chunks.append(choice.delta.content)
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+        
+        return "".join(chunks), finish_reason
+    
+    @staticmethod
+    def _generate_basic_template(project_name: str, endpoints: List[Dict[str, Any]]):
         """Generate a basic OpenAPI template without GPT"""
         paths = {}
         
@@ -167,32 +410,20 @@ class OpenAPIGenerator:
             method = endpoint["method"].lower()
             path = endpoint["path"]
             
-            if path not in paths:
-                paths[path] = {}
-            
-            paths[path][method] = {
+            paths.setdefault(path, {})[method] = {
                 "summary": f"{method.upper()} {path}",
                 "description": f"Endpoint for {method.upper()} {path}",
-                "parameters": [],
-                "responses": {}
-            }
-            
-            # Add query parameters
-            if endpoint["query_params"]:
-                for param_name in endpoint["query_params"]:
-                    paths[path][method]["parameters"].append({
-                        "name": param_name,
-                        "in": "query",
-                        "schema": {
-                            "type": "string"
-                        }
-                    })
-            
-            # Add responses
-            for status_code in endpoint["status_codes"]:
-                paths[path][method]["responses"][str(status_code)] = {
-                    "description": f"Status code {status_code} response"
+                # Add query parameters
+                "parameters": [
+                    {"name": param_name, "in": "query", "schema": {"type": "string"}}
+                    for param_name in endpoint["query_params"] or ()
+                ],
+                # Add responses
+                "responses": {
+                    str(status_code): {"description": f"Status code {status_code} response"}
+                    for status_code in endpoint["status_codes"]
                 }
+            }
         
         # Create OpenAPI spec
         openapi_spec = {
@@ -1,12 +1,17 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, JSON, Enum, Text, Boolean
+from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, JSON, Enum, Text, Boolean, Index, event, text
 from sqlalchemy.dialects.postgresql import UUID, INET, JSONB
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import date, timedelta
 import uuid
 import enum
 
 Base = declarative_base()
 
+# Countries flagged by the suspicious location detector
+SUSPICIOUS_COUNTRIES = ["KP", "IR", "SY", "CU"]
+
 class User(Base):
     __tablename__ = "users"
     
@@ -29,6 +34,9 @@ class Project(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     request_count = Column(Integer, default=0)
     
+    anomalies = relationship("Anomaly", back_populates="project", passive_deletes=True)
+    alert_channels = relationship("AlertChannel", back_populates="project", passive_deletes=True)
+    
 class ApiRequest(Base):
     __tablename__ = "api_requests"
     
@@ -43,7 +51,54 @@ class ApiRequest(Base):
     ip = Column(INET)
     user_agent = Column(Text)
     country_code = Column(String(2))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key, so it is part of the primary key
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    
+    # Indexes backing the anomaly detector's time-window queries; the table
+    # is partitioned by month on created_at
+    __table_args__ = (
+        Index("ix_api_requests_project_created", project_id, created_at.desc()),
+        Index("ix_api_requests_project_created_ip", project_id, created_at, ip),
+        Index("ix_api_requests_project_created_method_path", project_id, created_at, method, path),
+        Index(
+            "ix_api_requests_project_country",
+            project_id, country_code, created_at,
+            postgresql_where=country_code.in_(SUSPICIOUS_COUNTRIES)
+        ),
+        # Index for the doc generator's latest samples per endpoint (JSONB
+        # columns stay out of INCLUDE; large values would exceed the btree
+        # row size limit and abort whole ingest batches)
+        Index(
+            "ix_api_requests_pmp_created",
+            project_id, method, path, created_at.desc(),
+            postgresql_include=["status_code"]
+        ),
+        # Compact range index for recency scans (rows arrive in time order)
+        Index(
+            "ix_api_requests_created_brin",
+            created_at,
+            postgresql_using="brin",
+            postgresql_with={"pages_per_range": 32}
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+def create_api_request_partitions(connection, months_ahead: int = 2):
+    """Create monthly api_requests partitions from the current month on"""
+    month = date.today().replace(day=1)
+    for _ in range(months_ahead + 1):
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS api_requests_{month:%Y_%m} PARTITION OF api_requests "
+            f"FOR VALUES FROM ('{month} 00:00+00') TO ('{next_month} 00:00+00')"
+        ))
+        month = next_month
+
+@event.listens_for(ApiRequest.__table__, "after_create")
+def _create_initial_api_request_partitions(target, connection, **kw):
+    """Create the default and upcoming partitions along with the table"""
+    connection.execute(text("CREATE TABLE IF NOT EXISTS api_requests_default PARTITION OF api_requests DEFAULT"))
+    create_api_request_partitions(connection)
 
 class AnomalyType(str, enum.Enum):
     NEW_ENDPOINT = "new_endpoint"
@@ -72,6 +127,13 @@ class Anomaly(Base):
     resolved = Column(Boolean, default=False)
     resolved_at = Column(DateTime(timezone=True))
     processed = Column(Boolean, default=False)
+    
+    project = relationship("Project", back_populates="anomalies")
+    
+    # Index backing keyset pagination of anomaly lists
+    __table_args__ = (
+        Index("ix_anomalies_project_created_id", project_id, created_at.desc(), id.desc()),
+    )
 
 class ApiDoc(Base):
     __tablename__ = "api_docs"
@@ -79,6 +141,8 @@ class ApiDoc(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"), nullable=False)
     json_content = Column(JSONB, nullable=False)
+    # Fingerprint of the endpoints the spec was generated from
+    endpoints_hash = Column(String(64))
     generated_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class AlertChannel(Base):
@@ -90,4 +154,6 @@ class AlertChannel(Base):
     config = Column(JSONB, nullable=False)  # email address, webhook URL, etc.
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    active = Column(Boolean, default=True)
\ No newline at end of file
+    active = Column(Boolean, default=True)
+    
+    project = relationship("Project", back_populates="alert_channels")
\ No newline at end of file
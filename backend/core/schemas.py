@@ -1,8 +1,14 @@
-from pydantic import BaseModel, Field, EmailStr, validator, UUID4
+from pydantic import BaseModel, Field, EmailStr, validator, field_validator, model_validator, UUID4
 from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 from enum import Enum
 
+def _ip_to_str(value: Any) -> Any:
+    """Convert INET column values (ipaddress objects from asyncpg) to strings"""
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
 # User schemas
 class UserBase(BaseModel):
     email: EmailStr
@@ -48,8 +54,24 @@ class ApiRequestBase(BaseModel):
     user_agent: Optional[str] = None
     country_code: Optional[str] = None
 
+# Headers never stored with captured requests
+SENSITIVE_HEADERS = frozenset({"authorization", "cookie", "set-cookie", "proxy-authorization"})
+
 class ApiRequestCreate(ApiRequestBase):
-    pass
+    @model_validator(mode="before")
+    @classmethod
+    def strip_sensitive_headers(cls, data: Any) -> Any:
+        """Drop credentials from captured headers before they are stored"""
+        if isinstance(data, dict) and isinstance(data.get("headers"), dict):
+            data = {
+                **data,
+                "headers": {
+                    key: value
+                    for key, value in data["headers"].items()
+                    if key.lower() not in SENSITIVE_HEADERS
+                }
+            }
+        return data
 
 class ApiRequestBatch(BaseModel):
     requests: List[ApiRequestCreate]
@@ -59,6 +81,8 @@ class ApiRequestResponse(ApiRequestBase):
     project_id: UUID4
     created_at: datetime
     
+    _ip_as_str = field_validator("ip", mode="before")(_ip_to_str)
+    
     class Config:
         from_attributes = True
 
@@ -82,6 +106,8 @@ class AnomalyBase(BaseModel):
     ip: Optional[str] = None
     message: str
     severity: AnomalySeverity
+    
+    _ip_as_str = field_validator("ip", mode="before")(_ip_to_str)
 
 class AnomalyCreate(AnomalyBase):
     project_id: UUID4
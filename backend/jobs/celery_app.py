@@ -1,7 +1,10 @@
 from celery import Celery
+from celery.signals import worker_process_init
 from dotenv import load_dotenv
 import os
 
+from core.database import engine
+
 # Load environment variables
 load_dotenv()
 
@@ -25,9 +28,35 @@ celery_app.conf.update(
     enable_utc=True,
     task_track_started=True,
     task_time_limit=300,  # 5 minutes
-    worker_max_tasks_per_child=1000,
-    worker_prefetch_multiplier=1
+    # CPU-bound detection and I/O-bound alert/doc tasks run on separate
+    # workers, each with its own pool and prefetch settings (see README)
+    task_routes={
+        "jobs.tasks.detect_anomalies": {"queue": "cpu"},
+        "jobs.tasks.send_anomaly_alert": {"queue": "io"},
+        "jobs.tasks.send_anomaly_alerts": {"queue": "io"},
+        "jobs.tasks.generate_api_docs": {"queue": "io"},
+        "jobs.tasks.generate_api_docs_batch": {"queue": "io"}
+    },
+    beat_schedule={
+        "flush-request-counts": {
+            "task": "jobs.tasks.flush_request_counts",
+            "schedule": 30.0
+        },
+        "dispatch-queued-detections": {
+            "task": "jobs.tasks.dispatch_queued_detections",
+            "schedule": 10.0
+        },
+        "maintain-api-request-partitions": {
+            "task": "jobs.tasks.maintain_api_request_partitions",
+            "schedule": 86400.0
+        }
+    }
 )
 
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """Give each forked worker process its own database connections"""
+    engine.dispose(close=False)
+
 if __name__ == "__main__":
     celery_app.start()
\ No newline at end of file
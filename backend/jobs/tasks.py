@@ -1,13 +1,42 @@
 from jobs.celery_app import celery_app
+from celery import group
+from sqlalchemy import update, func
 from sqlalchemy.orm import Session
+from redis.exceptions import ResponseError
+from typing import Dict, List
+import asyncio
+import os
 import uuid
-from datetime import datetime, timedelta
+from datetime import timedelta
 
-from core.database import SessionLocal
+from core.database import session_scope, engine
 from core.anomaly_detector import AnomalyDetector
 from core.doc_generator import OpenAPIGenerator
-from core.alert_system import AlertSystem
-from core.models import Project, Anomaly
+from core.alert_system import AlertSystem, create_http_client
+from core.models import Project, Anomaly, create_api_request_partitions
+from core.cache import (
+    sync_redis_client,
+    request_count_key,
+    REQUEST_COUNTS_KEY,
+    DETECTION_STREAM,
+    DETECTION_GROUP
+)
+
+# Number of projects handed to one batched doc generation task
+DOC_BATCH_SIZE = int(os.getenv("DOC_BATCH_SIZE", 10))
+
+# Number of anomalies handed to one batched alert task
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", 100))
+
+async def _send_alert(db: Session, anomaly_id: str) -> bool:
+    """Send alert for an anomaly over a fresh HTTP client"""
+    async with create_http_client() as http_client:
+        return await AlertSystem(db, http_client).send_alert(anomaly_id)
+
+async def _send_alerts(db: Session, anomaly_ids: List[str]) -> Dict[str, bool]:
+    """Send alerts for several anomalies over one shared HTTP client"""
+    async with create_http_client() as http_client:
+        return await AlertSystem(db, http_client).send_alerts(anomaly_ids)
 
 @celery_app.task
 def detect_anomalies(project_id: str):
@@ -17,8 +46,7 @@ def detect_anomalies(project_id: str):
     This task runs the anomaly detection algorithms and creates
     anomaly records in the database.
     """
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         # Convert string to UUID
         project_uuid = uuid.UUID(project_id)
         
@@ -30,8 +58,6 @@ def detect_anomalies(project_id: str):
         
         # Return number of anomalies detected
         return len(anomalies)
-    finally:
-        db.close()
 
 @celery_app.task
 def generate_api_docs(project_id: str):
@@ -41,8 +67,7 @@ def generate_api_docs(project_id: str):
     This task analyzes API request logs and generates OpenAPI
     documentation using GPT.
     """
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         # Convert string to UUID
         project_uuid = uuid.UUID(project_id)
         
@@ -54,29 +79,54 @@ def generate_api_docs(project_id: str):
         
         # Return success status
         return api_doc is not None
-    finally:
-        db.close()
 
 @celery_app.task
-async def send_anomaly_alert(anomaly_id: str):
+def generate_api_docs_batch(project_ids: List[str]):
+    """
+    Background task to generate API documentation for several projects
+    
+    Projects are packed into as few GPT requests as the model's token
+    budget allows.
+    """
+    with session_scope() as db:
+        # Convert strings to UUIDs
+        project_uuids = [uuid.UUID(project_id) for project_id in project_ids]
+        
+        # Generate OpenAPI specs
+        api_docs = OpenAPIGenerator.generate_openapi_specs(db, project_uuids)
+        
+        # Return number of documents generated
+        return len(api_docs)
+
+@celery_app.task
+def send_anomaly_alert(anomaly_id: str):
     """
     Background task to send alerts for an anomaly
     
     This task sends alerts via configured channels (email, Slack, webhook)
     for a specific anomaly.
     """
-    db = SessionLocal()
-    try:
-        # Create alert system
-        alert_system = AlertSystem(db)
-        
-        # Send alert
-        success = await alert_system.send_alert(anomaly_id)
+    with session_scope() as db:
+        # Send alert (Celery tasks are synchronous, so run the coroutine
+        # on its own event loop)
+        success = asyncio.run(_send_alert(db, anomaly_id))
         
         # Return success status
         return success
-    finally:
-        db.close()
+
+@celery_app.task
+def send_anomaly_alerts(anomaly_ids: List[str]):
+    """
+    Background task to send alerts for several anomalies
+    
+    All alerts of the batch are sent concurrently over one HTTP client.
+    """
+    with session_scope() as db:
+        # Send alerts
+        results = asyncio.run(_send_alerts(db, anomaly_ids))
+        
+        # Return number of alerts delivered
+        return sum(results.values())
 
 @celery_app.task
 def schedule_anomaly_detection():
@@ -86,19 +136,64 @@ def schedule_anomaly_detection():
     This task is scheduled to run periodically and triggers
     anomaly detection for all active projects.
     """
-    db = SessionLocal()
-    try:
-        # Get all projects
-        projects = db.query(Project).all()
+    with session_scope() as db:
+        # Get all project IDs
+        project_ids = [str(project_id) for (project_id,) in db.query(Project.id).yield_per(1000)]
         
-        # Schedule anomaly detection for each project
-        for project in projects:
-            detect_anomalies.delay(str(project.id))
+        # Schedule anomaly detection for each project in one dispatch
+        if project_ids:
+            group(detect_anomalies.s(project_id) for project_id in project_ids).apply_async()
         
         # Return number of projects processed
-        return len(projects)
-    finally:
-        db.close()
+        return len(project_ids)
+
+@celery_app.task
+def dispatch_queued_detections():
+    """
+    Scheduled task to run anomaly detection for projects queued by ingestion
+    
+    Ingestion adds a project to the detection stream at most once per
+    debounce window. This task drains the stream and triggers one
+    detection per distinct project.
+    """
+    # Create consumer group on first run
+    try:
+        sync_redis_client.xgroup_create(DETECTION_STREAM, DETECTION_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    
+    # Read projects left unacknowledged by a failed run ("0" re-reads the
+    # pending entries of this consumer), then newly queued ones (">")
+    entries = []
+    for last_id in ("0", ">"):
+        entries.extend(sync_redis_client.xreadgroup(
+            DETECTION_GROUP,
+            "dispatcher",
+            {DETECTION_STREAM: last_id},
+            count=1000
+        ) or [])
+    
+    project_ids = set()
+    message_ids = []
+    for _stream, messages in entries:
+        for message_id, fields in messages:
+            # Pending entries already deleted from the stream have no fields
+            if fields:
+                project_ids.add(fields["project_id"])
+            message_ids.append(message_id)
+    
+    # Schedule anomaly detection for each project in one dispatch
+    if project_ids:
+        group(detect_anomalies.s(project_id) for project_id in project_ids).apply_async()
+    
+    # Acknowledge and remove dispatched messages
+    if message_ids:
+        sync_redis_client.xack(DETECTION_STREAM, DETECTION_GROUP, *message_ids)
+        sync_redis_client.xdel(DETECTION_STREAM, *message_ids)
+    
+    # Return number of projects dispatched
+    return len(project_ids)
 
 @celery_app.task
 def schedule_api_doc_generation():
@@ -106,49 +201,116 @@ def schedule_api_doc_generation():
     Scheduled task to run API documentation generation for all projects
     
     This task is scheduled to run periodically and triggers
-    API documentation generation for all active projects.
+    API documentation generation for all active projects. Projects
+    are ordered by traffic so each batch holds projects of similar size.
     """
-    db = SessionLocal()
-    try:
-        # Get all projects
-        projects = db.query(Project).all()
+    with session_scope() as db:
+        # Get all project IDs
+        project_ids = [
+            str(project_id)
+            for (project_id,) in db.query(Project.id).order_by(Project.request_count).yield_per(1000)
+        ]
         
-        # Schedule API doc generation for each project
-        for project in projects:
-            generate_api_docs.delay(str(project.id))
+        # Schedule batched API doc generation in one dispatch
+        if project_ids:
+            group(
+                generate_api_docs_batch.s(project_ids[start:start + DOC_BATCH_SIZE])
+                for start in range(0, len(project_ids), DOC_BATCH_SIZE)
+            ).apply_async()
         
         # Return number of projects processed
-        return len(projects)
-    finally:
-        db.close()
+        return len(project_ids)
 
 @celery_app.task
-async def process_new_anomalies():
+def process_new_anomalies():
     """
     Scheduled task to process and send alerts for new anomalies
     
     This task is scheduled to run periodically and sends alerts
     for new anomalies that haven't been processed yet.
     """
-    db = SessionLocal()
-    try:
-        # Get recent unprocessed anomalies (last hour)
-        recent_time = datetime.utcnow() - timedelta(hours=1)
-        anomalies = db.query(Anomaly).filter(
-            Anomaly.created_at >= recent_time,
-            Anomaly.processed == False
-        ).all()
-        
-        # Send alerts for each anomaly
-        for anomaly in anomalies:
-            # Mark as processed
-            anomaly.processed = True
-            db.commit()
-            
-            # Send alert
-            await send_anomaly_alert.delay(str(anomaly.id))
+    with session_scope() as db:
+        # Claim recent unprocessed anomalies (last hour) in a single
+        # UPDATE ... RETURNING
+        recent_time = func.now() - timedelta(hours=1)
+        anomalies = Anomaly.__table__
+        anomaly_ids = db.execute(
+            update(anomalies)
+            .where(anomalies.c.created_at >= recent_time, anomalies.c.processed == False)
+            .values(processed=True)
+            .returning(anomalies.c.id)
+        ).scalars().all()
+        db.commit()
+        
+        # Send alerts for all claimed anomalies in batches, in one dispatch
+        anomaly_ids = [str(anomaly_id) for anomaly_id in anomaly_ids]
+        if anomaly_ids:
+            group(
+                send_anomaly_alerts.s(anomaly_ids[start:start + ALERT_BATCH_SIZE])
+                for start in range(0, len(anomaly_ids), ALERT_BATCH_SIZE)
+            ).apply_async()
         
         # Return number of anomalies processed
-        return len(anomalies)
-    finally:
-        db.close()
\ No newline at end of file
+        return len(anomaly_ids)
+
+@celery_app.task
+def flush_request_counts():
+    """
+    Scheduled task to flush buffered project request counts
+    
+    Ingestion increments per-project counters in Redis instead of updating
+    the projects row on every batch. This task moves the accumulated deltas
+    into the database with one UPDATE per project.
+    """
+    with session_scope() as db:
+        flushed = 0
+        
+        while True:
+            project_ids = sync_redis_client.spop(REQUEST_COUNTS_KEY, 1000)
+            if not project_ids:
+                break
+            
+            # Read and reset the counters atomically
+            deltas = {}
+            for project_id in project_ids:
+                pipe = sync_redis_client.pipeline(transaction=True)
+                pipe.get(request_count_key(project_id))
+                pipe.delete(request_count_key(project_id))
+                delta, _ = pipe.execute()
+                
+                if delta:
+                    deltas[project_id] = int(delta)
+            
+            try:
+                for project_id, delta in deltas.items():
+                    db.execute(
+                        update(Project.__table__)
+                        .where(Project.__table__.c.id == uuid.UUID(project_id))
+                        .values(request_count=Project.__table__.c.request_count + delta)
+                    )
+                db.commit()
+            except Exception:
+                # Put the counts back so the next run flushes them
+                db.rollback()
+                pipe = sync_redis_client.pipeline(transaction=False)
+                for project_id, delta in deltas.items():
+                    pipe.incrby(request_count_key(project_id), delta)
+                    pipe.sadd(REQUEST_COUNTS_KEY, project_id)
+                pipe.execute()
+                raise
+            
+            flushed += len(deltas)
+        
+        # Return number of projects flushed
+        return flushed
+
+@celery_app.task
+def maintain_api_request_partitions():
+    """
+    Scheduled task to create upcoming api_requests partitions
+    
+    Monthly partitions are created a couple of months ahead, so new rows
+    never have to fall back to the default partition.
+    """
+    with engine.begin() as connection:
+        create_api_request_partitions(connection)
@@ -2,6 +2,7 @@ from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from dotenv import load_dotenv
+import anyio
 import os
 
 # Load environment variables
@@ -14,13 +15,21 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# Configure CORS
+# Configure CORS (comma-separated origins; browsers reject "*" with credentials)
+allowed_origins = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins
+    allow_origins=allowed_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
+    allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-Next-Cursor"],
+    max_age=86400,  # Cache preflight responses for 24 hours
 )
 
 # Import routers
@@ -37,6 +46,12 @@ app.include_router(projects_router, prefix="/api/projects", tags=["Projects"])
 app.include_router(anomalies_router, prefix="/api/anomalies", tags=["Anomalies"])
 app.include_router(docs_router, prefix="/api/docs", tags=["API Documentation"])
 
+@app.on_event("startup")
+async def configure_thread_pool():
+    """Size the thread pool used for blocking work (password hashing)"""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("THREAD_POOL_SIZE", 100))
+
 @app.get("/", tags=["Health"])
 async def root():
     """Health check endpoint"""
@@ -0,0 +1,18 @@
+-- Composite indexes backing the anomaly detector's time-window queries.
+--
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so run
+-- this file with autocommit (e.g. `psql -f`), not wrapped in BEGIN/COMMIT.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_requests_project_created
+    ON api_requests (project_id, created_at DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_requests_project_created_ip
+    ON api_requests (project_id, created_at, ip);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_requests_project_created_method_path
+    ON api_requests (project_id, created_at, method, path);
+
+-- Must match core.models.SUSPICIOUS_COUNTRIES
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_requests_project_country
+    ON api_requests (project_id, country_code, created_at)
+    WHERE country_code IN ('KP', 'IR', 'SY', 'CU');
@@ -0,0 +1,7 @@
+-- Index backing keyset pagination of anomaly lists
+-- (ORDER BY created_at DESC, id DESC per project).
+--
+-- Run with autocommit; CREATE INDEX CONCURRENTLY cannot run in a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_anomalies_project_created_id
+    ON anomalies (project_id, created_at DESC, id DESC);
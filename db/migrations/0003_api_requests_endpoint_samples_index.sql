@@ -0,0 +1,9 @@
+-- Index for the doc generator's endpoint samples (latest requests per
+-- method/path of a project). Only status_code is included; the JSONB
+-- query_params and headers are unbounded and are read from the heap.
+--
+-- Run with autocommit; CREATE INDEX CONCURRENTLY cannot run in a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_api_requests_pmp_created
+    ON api_requests (project_id, method, path, created_at DESC)
+    INCLUDE (status_code);
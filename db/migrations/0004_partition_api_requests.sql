@@ -0,0 +1,69 @@
+-- Convert api_requests into a table partitioned by month on created_at,
+-- with a BRIN index for recency scans. Upcoming partitions are created
+-- by the create_api_request_partitions task; rows outside every monthly
+-- partition land in api_requests_default.
+--
+-- Copies all rows into the new table; run in a maintenance window.
+
+BEGIN;
+
+ALTER TABLE api_requests RENAME TO api_requests_unpartitioned;
+ALTER TABLE api_requests_unpartitioned RENAME CONSTRAINT api_requests_pkey TO api_requests_unpartitioned_pkey;
+
+CREATE TABLE api_requests (
+    LIKE api_requests_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (project_id) REFERENCES projects (id)
+) PARTITION BY RANGE (created_at);
+
+-- Monthly partitions covering existing rows and the next two months
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce(bounds.first_created_at, now()) AT TIME ZONE 'UTC'),
+            date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months',
+            interval '1 month'
+        )::date
+        FROM (SELECT min(created_at) AS first_created_at FROM api_requests_unpartitioned) bounds
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE api_requests_%s PARTITION OF api_requests FOR VALUES FROM (%L) TO (%L)',
+            to_char(month, 'YYYY_MM'),
+            month::text || ' 00:00+00',
+            (month + interval '1 month')::date::text || ' 00:00+00'
+        );
+    END LOOP;
+END $$;
+
+CREATE TABLE api_requests_default PARTITION OF api_requests DEFAULT;
+
+INSERT INTO api_requests SELECT * FROM api_requests_unpartitioned;
+
+DROP TABLE api_requests_unpartitioned;
+
+-- Indexes on a partitioned table can't be built CONCURRENTLY; they are
+-- created on every partition
+CREATE INDEX ix_api_requests_project_created
+    ON api_requests (project_id, created_at DESC);
+
+CREATE INDEX ix_api_requests_project_created_ip
+    ON api_requests (project_id, created_at, ip);
+
+CREATE INDEX ix_api_requests_project_created_method_path
+    ON api_requests (project_id, created_at, method, path);
+
+CREATE INDEX ix_api_requests_project_country
+    ON api_requests (project_id, country_code, created_at)
+    WHERE country_code IN ('KP', 'IR', 'SY', 'CU');
+
+CREATE INDEX ix_api_requests_pmp_created
+    ON api_requests (project_id, method, path, created_at DESC)
+    INCLUDE (status_code);
+
+CREATE INDEX ix_api_requests_created_brin
+    ON api_requests USING BRIN (created_at) WITH (pages_per_range = 32);
+
+COMMIT;
@@ -0,0 +1,4 @@
+-- Fingerprint of the endpoints each API doc was generated from, so doc
+-- generation can skip GPT when traffic hasn't changed.
+
+ALTER TABLE api_docs ADD COLUMN IF NOT EXISTS endpoints_hash VARCHAR(64);
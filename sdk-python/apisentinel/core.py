@@ -3,19 +3,91 @@ Core functionality for API Sentinel SDK
 """
 
 import time
+import collections
 import threading
-import json
 import socket
+import atexit
+import dataclasses
+import functools
+import gzip
+import ipaddress
+import orjson
 import requests
-from typing import Dict, List, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, List, Any, Mapping, Optional
 import logging
 import geoip2.database
 import os
-import pkg_resources
+import re
+
+try:
+    from importlib.resources import files as resource_files
+except ImportError:  # Python < 3.9
+    resource_files = None
 
 # Configure logging
 logger = logging.getLogger("apisentinel")
 
+# GeoIP database bundled with the geoip2 package
+GEOIP_DATABASE = "GeoLite2-Country.mmdb"
+
+@functools.lru_cache(maxsize=1)
+def _get_reader() -> Optional[geoip2.database.Reader]:
+    """Open the GeoIP database once per process, shared by all SentinelCore instances"""
+    try:
+        if resource_files is not None:
+            geoip_path = str(resource_files("geoip2").joinpath(GEOIP_DATABASE))
+        else:
+            geoip_path = os.path.join(os.path.dirname(geoip2.__file__), GEOIP_DATABASE)
+        
+        if os.path.exists(geoip_path):
+            return geoip2.database.Reader(geoip_path)
+    except Exception as e:
+        logger.warning(f"Failed to load GeoIP database: {e}")
+    
+    return None
+
+@functools.lru_cache(maxsize=2048)
+def _is_private(ip: str) -> bool:
+    """Check if an IP address is private, loopback or invalid (not geolocatable)"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return True
+    return address.is_private or address.is_loopback
+
+@dataclasses.dataclass
+class RequestLog:
+    """
+    Captured API request metadata
+    
+    Declares __slots__ explicitly (dataclass(slots=True) needs Python 3.10)
+    to keep queued requests small.
+    """
+    
+    __slots__ = (
+        "method",
+        "path",
+        "query_params",
+        "headers",
+        "status_code",
+        "latency_ms",
+        "ip",
+        "user_agent",
+        "country_code"
+    )
+    
+    method: str
+    path: str
+    query_params: Dict[str, Any]
+    headers: Mapping[str, str]
+    status_code: int
+    latency_ms: int
+    ip: str
+    user_agent: Optional[str]
+    country_code: Optional[str]
+
 class SentinelCore:
     """
     Core functionality for API Sentinel SDK
@@ -32,7 +104,10 @@ class SentinelCore:
         batch_interval: int = 3,
         ignore_paths: List[str] = None,
         sensitive_headers: List[str] = None,
-        sensitive_params: List[str] = None
+        sensitive_params: List[str] = None,
+        compress: bool = True,
+        max_queue_size: int = 1000,
+        headers_already_lower: bool = False
     ):
         """
         Initialize SentinelCore
@@ -45,37 +120,66 @@ class SentinelCore:
             ignore_paths: Paths to exclude from monitoring
             sensitive_headers: Headers to sanitize in logs
             sensitive_params: Query parameters to sanitize in logs
+            compress: Gzip batches before sending them
+            max_queue_size: Maximum number of requests buffered while the backend is unreachable
+            headers_already_lower: Header names are passed lowercased (e.g. by ASGI
+                frameworks), so sanitizing can skip lowercasing them
         """
         self.api_key = api_key
-        self.api_url = api_url
+        self.api_url = api_url.rstrip("/")
         self.batch_size = batch_size
         self.batch_interval = batch_interval
-        self.ignore_paths = ignore_paths or []
+        self.compress = compress
+        self.max_queue_size = max_queue_size
+        self.headers_already_lower = headers_already_lower
         self.sensitive_headers = sensitive_headers or ["authorization", "cookie", "set-cookie"]
         self.sensitive_params = sensitive_params or ["password", "token", "key", "secret", "auth"]
         
-        # Request queue
-        self.request_queue = []
-        self.queue_lock = threading.Lock()
+        # Precompiled matchers for ignored paths and sanitizing
+        self._ignore_re = (
+            re.compile("^(?:" + "|".join(map(re.escape, ignore_paths)) + ")")
+            if ignore_paths else None
+        )
+        self._sensitive_headers = frozenset(header.lower() for header in self.sensitive_headers)
+        self._sensitive_param_re = re.compile("|".join(map(re.escape, self.sensitive_params)), re.IGNORECASE)
+        
+        # Request buffer (bounded; the oldest requests are dropped when it is
+        # full). deque.append and popleft are atomic, so neither request
+        # handlers nor the flusher need a lock.
+        self._buf = collections.deque()
+        self._dropped = 0
         
-        # Batch timer
-        self.timer = None
+        # HTTP session (keeps the connection to the backend alive between batches)
+        self._ingest_url = f"{self.api_url}/api/ingest"
+        self._session = self._create_session()
+        atexit.register(self.close)
         
         # GeoIP database
-        self.geoip_reader = None
-        try:
-            geoip_path = pkg_resources.resource_filename("geoip2", "GeoLite2-Country.mmdb")
-            if os.path.exists(geoip_path):
-                self.geoip_reader = geoip2.database.Reader(geoip_path)
-        except Exception as e:
-            logger.warning(f"Failed to load GeoIP database: {e}")
+        self.geoip_reader = _get_reader()
+        
+        # Country codes of recently seen IPs
+        self._country_cache = functools.lru_cache(maxsize=4096)(self._lookup_country_uncached)
+        
+        # Background flusher sending batches off the request path (woken early
+        # once a full batch is queued). Started on the first captured request
+        # in each process, since threads don't survive fork() and preforking
+        # servers often build the middleware in the master.
+        self._flush_evt = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        
+        # Forked children start from a clean slate (POSIX only)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
     
     def capture_request(
         self,
         method: str,
         path: str,
         query_params: Dict[str, Any],
-        headers: Dict[str, str],
+        headers: Mapping[str, str],
         status_code: int,
         latency_ms: int,
         ip: str,
@@ -88,67 +192,76 @@ class SentinelCore:
             method: HTTP method (GET, POST, etc.)
             path: Request path
             query_params: Query parameters
-            headers: Request headers
+            headers: Request headers (any mapping, e.g. the framework's own headers object)
             status_code: Response status code
             latency_ms: Request latency in milliseconds
             ip: Client IP address
             user_agent: User-Agent string
         """
         # Skip ignored paths
-        if any(path.startswith(ignore_path) for ignore_path in self.ignore_paths):
+        if self._ignore_re is not None and self._ignore_re.match(path):
             return
         
-        # Sanitize headers
-        sanitized_headers = self._sanitize_headers(headers)
-        
-        # Sanitize query parameters
-        sanitized_params = self._sanitize_query_params(query_params)
-        
-        # Get country code from IP
-        country_code = self._get_country_code(ip)
-        
-        # Create request log
-        request_log = {
-            "method": method,
-            "path": path,
-            "query_params": sanitized_params,
-            "headers": sanitized_headers,
-            "status_code": status_code,
-            "latency_ms": latency_ms,
-            "ip": ip,
-            "user_agent": user_agent,
-            "country_code": country_code
-        }
+        # Create request log (sanitized and geolocated later by the flusher,
+        # off the request path and the event loop)
+        request_log = RequestLog(
+            method=method,
+            path=path,
+            query_params=query_params,
+            headers=headers,
+            status_code=status_code,
+            latency_ms=latency_ms,
+            ip=ip,
+            user_agent=user_agent,
+            country_code=None
+        )
         
-        # Add to queue
-        with self.queue_lock:
-            self.request_queue.append(request_log)
-            
-            # Send batch if queue is full
-            if len(self.request_queue) >= self.batch_size:
-                self._send_batch()
-            else:
-                self._start_timer()
+        # Make sure this process has a running flusher
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+        
+        # Add to buffer (never blocks the request)
+        if len(self._buf) >= self.max_queue_size:
+            try:
+                self._buf.popleft()
+                self._dropped += 1
+            except IndexError:
+                pass
+        self._buf.append(request_log)
+        
+        # Wake the flusher once a full batch is waiting
+        if len(self._buf) >= self.batch_size:
+            self._flush_evt.set()
     
-    def _sanitize_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+    def _sanitize_headers(self, headers: Mapping[str, str]) -> Dict[str, str]:
         """
         Sanitize headers by redacting sensitive values
         
         Args:
-            headers: Request headers
+            headers: Request headers (read directly, without an intermediate copy)
             
         Returns:
             Sanitized headers
         """
-        sanitized = {}
+        if self.headers_already_lower:
+            keys = headers.keys()
+        else:
+            keys = {key.lower() for key in headers.keys()}
+        
+        # Nothing to redact (the common case): copy without rebuilding
+        if self._sensitive_headers.isdisjoint(keys):
+            return headers if isinstance(headers, dict) else dict(headers)
         
-        for key, value in headers.items():
-            if key.lower() in self.sensitive_headers:
-                sanitized[key] = "[REDACTED]"
-            else:
-                sanitized[key] = value
+        if self.headers_already_lower:
+            return {
+                key: "[REDACTED]" if key in self._sensitive_headers else value
+                for key, value in headers.items()
+            }
         
-        return sanitized
+        return {
+            key: "[REDACTED]" if key.lower() in self._sensitive_headers else value
+            for key, value in headers.items()
+        }
     
     def _sanitize_query_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -160,15 +273,14 @@ class SentinelCore:
         Returns:
             Sanitized query parameters
         """
-        sanitized = {}
-        
-        for key, value in params.items():
-            if any(sensitive in key.lower() for sensitive in self.sensitive_params):
-                sanitized[key] = "[REDACTED]"
-            else:
-                sanitized[key] = value
+        # Nothing to redact (the common case)
+        if not any(self._sensitive_param_re.search(key) for key in params):
+            return params
         
-        return sanitized
+        return {
+            key: "[REDACTED]" if self._sensitive_param_re.search(key) else value
+            for key, value in params.items()
+        }
     
     def _get_country_code(self, ip: str) -> Optional[str]:
         """
@@ -180,9 +292,21 @@ class SentinelCore:
         Returns:
             Country code (ISO 3166-1 alpha-2) or None
         """
-        if not ip or ip == "127.0.0.1" or ip.startswith("192.168.") or ip.startswith("10."):
+        if not ip or _is_private(ip):
             return None
         
+        return self._country_cache(ip)
+    
+    def _lookup_country_uncached(self, ip: str) -> Optional[str]:
+        """
+        Look up country code of an IP address in the GeoIP database
+        
+        Args:
+            ip: IP address
+            
+        Returns:
+            Country code (ISO 3166-1 alpha-2) or None
+        """
         try:
             if self.geoip_reader:
                 response = self.geoip_reader.country(ip)
@@ -192,45 +316,151 @@ class SentinelCore:
         
         return None
     
-    def _start_timer(self):
-        """Start batch timer"""
-        if self.timer:
-            self.timer.cancel()
+    def stats(self) -> Dict[str, int]:
+        """
+        Get buffer statistics
         
-        self.timer = threading.Timer(self.batch_interval, self._send_batch)
-        self.timer.daemon = True
-        self.timer.start()
+        Returns:
+            Number of requests waiting to be sent and number of requests
+            dropped because the buffer was full
+        """
+        return {"queued": len(self._buf), "dropped": self._dropped}
     
-    def _send_batch(self):
-        """Send batched requests to API Sentinel"""
-        with self.queue_lock:
-            if not self.request_queue:
+    def close(self):
+        """Stop the flusher, send remaining requests and close the HTTP session"""
+        self._stop.set()
+        self._flush_evt.set()
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            self._flusher.join(timeout=5)
+        self._flush()
+        self._session.close()
+    
+    def _create_session(self) -> requests.Session:
+        """Create the HTTP session used to send batches"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=4,
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.2,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=frozenset(["POST"])
+            )
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        if self.compress:
+            session.headers["Content-Encoding"] = "gzip"
+        return session
+    
+    def _after_fork(self):
+        """
+        Reset state inherited from the parent process in a forked child
+        
+        The parent's buffered requests are sent by the parent, so the child
+        drops its copy (instead of sending duplicates) and resets its stats.
+        Its connections and synchronization primitives are replaced too,
+        as they may be shared with or held by the parent's threads.
+        """
+        self._buf.clear()
+        self._dropped = 0
+        self._session = self._create_session()
+        self._flush_evt = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+    
+    def _start_flusher(self):
+        """Start the flusher thread of the current process"""
+        with self._flusher_lock:
+            pid = os.getpid()
+            if self._flusher_pid == pid:
                 return
             
-            batch = self.request_queue.copy()
-            self.request_queue = []
+            self._flusher = threading.Thread(target=self._run, name="apisentinel-flusher", daemon=True)
+            self._flusher.start()
+            self._flusher_pid = pid
+    
+    def _run(self):
+        """Flush queued requests every batch interval or when a batch is full"""
+        while not self._stop.is_set():
+            self._flush_evt.wait(self.batch_interval)
+            self._flush_evt.clear()
+            
+            if not self._flush():
+                # Back off before retrying
+                self._stop.wait(self.batch_interval)
+    
+    def _flush(self) -> bool:
+        """Send all queued requests in batches"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._prepare(self._buf.popleft()))
+                except IndexError:
+                    break
+            
+            if not batch:
+                return True
+            
+            if not self._send_batch(batch):
+                # Put requests back for the next flush
+                self._requeue(batch)
+                return False
+    
+    def _prepare(self, request_log: RequestLog) -> RequestLog:
+        """
+        Sanitize a captured request and resolve its country code
+        
+        Safe to repeat for requests put back after a failed send.
+        
+        Args:
+            request_log: Captured request
+            
+        Returns:
+            The same request log, ready to send
+        """
+        request_log.headers = self._sanitize_headers(request_log.headers)
+        request_log.query_params = self._sanitize_query_params(request_log.query_params)
+        request_log.country_code = self._get_country_code(request_log.ip)
+        return request_log
+    
+    def _requeue(self, batch: List[RequestLog]):
+        """Put requests of a failed batch back at the front of the buffer"""
+        self._buf.extendleft(reversed(batch))
         
+        # Drop the oldest requests beyond the cap
+        while len(self._buf) > self.max_queue_size:
+            self._buf.popleft()
+            self._dropped += 1
+    
+    def _send_batch(self, batch: List[RequestLog]) -> bool:
+        """Send batched requests to API Sentinel"""
         try:
-            response = requests.post(
-                f"{self.api_url}/api/ingest",
-                json={"requests": batch},
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
+            payload = orjson.dumps({"requests": batch})
+            if self.compress:
+                # Fastest level; request logs compress well even at level 1
+                payload = gzip.compress(payload, compresslevel=1)
+            
+            response = self._session.post(
+                self._ingest_url,
+                data=payload,
                 timeout=5
             )
             
             if response.status_code != 201:
                 logger.error(f"API Sentinel: Error sending batch: {response.status_code} {response.text}")
-                
-                # Add requests back to queue if sending fails
-                with self.queue_lock:
-                    self.request_queue = batch + self.request_queue
+                return False
         
         except Exception as e:
             logger.error(f"API Sentinel: Error sending batch: {str(e)}")
-            
-            # Add requests back to queue if sending fails
-            with self.queue_lock:
-                self.request_queue = batch + self.request_queue
\ No newline at end of file
+            return False
+        
+        return True
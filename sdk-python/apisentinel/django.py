@@ -41,7 +41,9 @@ class SentinelMiddleware:
             batch_interval=sentinel_settings.get("batch_interval", 3),
             ignore_paths=sentinel_settings.get("ignore_paths", []),
             sensitive_headers=sentinel_settings.get("sensitive_headers", ["authorization", "cookie", "set-cookie"]),
-            sensitive_params=sentinel_settings.get("sensitive_params", ["password", "token", "key", "secret", "auth"])
+            sensitive_params=sentinel_settings.get("sensitive_params", ["password", "token", "key", "secret", "auth"]),
+            compress=sentinel_settings.get("compress", True),
+            max_queue_size=sentinel_settings.get("max_queue_size", 1000)
         )
     
     def __call__(self, request):
@@ -55,28 +57,26 @@ class SentinelMiddleware:
             Django HttpResponse
         """
         # Record start time
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         # Process request
         response = self.get_response(request)
         
         # Calculate latency
-        latency_ms = int((time.time() - start_time) * 1000)
+        latency_ms = (time.perf_counter_ns() - start_time) // 1_000_000
         
         # Get client IP
         ip = self._get_client_ip(request)
         
         # Get query parameters
-        query_params = {}
-        for key, value in request.GET.items():
-            query_params[key] = value
+        query_params = dict(request.GET.items())
         
         # Capture request
         self.core.capture_request(
             method=request.method,
             path=request.path,
             query_params=query_params,
-            headers=dict(request.headers),
+            headers=request.headers,
             status_code=response.status_code,
             latency_ms=latency_ms,
             ip=ip,
@@ -97,7 +97,7 @@ class SentinelMiddleware:
         """
         x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
         if x_forwarded_for:
-            ip = x_forwarded_for.split(",")[0].strip()
+            ip = x_forwarded_for.partition(",")[0].strip()
         else:
             ip = request.META.get("REMOTE_ADDR")
         return ip
\ No newline at end of file
@@ -27,7 +27,9 @@ class SentinelMiddleware(BaseHTTPMiddleware):
         batch_interval: int = 3,
         ignore_paths: List[str] = None,
         sensitive_headers: List[str] = None,
-        sensitive_params: List[str] = None
+        sensitive_params: List[str] = None,
+        compress: bool = True,
+        max_queue_size: int = 1000
     ):
         """
         Initialize SentinelMiddleware
@@ -41,6 +43,8 @@ class SentinelMiddleware(BaseHTTPMiddleware):
             ignore_paths: Paths to exclude from monitoring
             sensitive_headers: Headers to sanitize in logs
             sensitive_params: Query parameters to sanitize in logs
+            compress: Gzip batches before sending them
+            max_queue_size: Maximum number of requests buffered while the backend is unreachable
         """
         super().__init__(app)
         self.core = SentinelCore(
@@ -50,7 +54,11 @@ class SentinelMiddleware(BaseHTTPMiddleware):
             batch_interval=batch_interval,
             ignore_paths=ignore_paths,
             sensitive_headers=sensitive_headers,
-            sensitive_params=sensitive_params
+            sensitive_params=sensitive_params,
+            compress=compress,
+            max_queue_size=max_queue_size,
+            # Starlette header names are always lowercase
+            headers_already_lower=True
         )
     
     async def dispatch(self, request: Request, call_next):
@@ -65,28 +73,26 @@ class SentinelMiddleware(BaseHTTPMiddleware):
             Starlette Response
         """
         # Record start time
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         # Process request
         response = await call_next(request)
         
         # Calculate latency
-        latency_ms = int((time.time() - start_time) * 1000)
+        latency_ms = (time.perf_counter_ns() - start_time) // 1_000_000
         
         # Get client IP
         ip = self._get_client_ip(request)
         
         # Get query parameters
-        query_params = {}
-        for key, value in request.query_params.items():
-            query_params[key] = value
+        query_params = dict(request.query_params)
         
         # Capture request
         self.core.capture_request(
             method=request.method,
             path=request.url.path,
             query_params=query_params,
-            headers=dict(request.headers),
+            headers=request.headers,
             status_code=response.status_code,
             latency_ms=latency_ms,
             ip=ip,
@@ -106,7 +112,7 @@ class SentinelMiddleware(BaseHTTPMiddleware):
             Client IP address
         """
         if "x-forwarded-for" in request.headers:
-            return request.headers["x-forwarded-for"].split(",")[0].strip()
+            return request.headers["x-forwarded-for"].partition(",")[0].strip()
         
         client = request.scope.get("client")
         if client:
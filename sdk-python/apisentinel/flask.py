@@ -25,7 +25,9 @@ class SentinelMiddleware:
         batch_interval: int = 3,
         ignore_paths: List[str] = None,
         sensitive_headers: List[str] = None,
-        sensitive_params: List[str] = None
+        sensitive_params: List[str] = None,
+        compress: bool = True,
+        max_queue_size: int = 1000
     ):
         """
         Initialize SentinelMiddleware
@@ -39,6 +41,8 @@ class SentinelMiddleware:
             ignore_paths: Paths to exclude from monitoring
             sensitive_headers: Headers to sanitize in logs
             sensitive_params: Query parameters to sanitize in logs
+            compress: Gzip batches before sending them
+            max_queue_size: Maximum number of requests buffered while the backend is unreachable
         """
         self.app = app
         self.core = SentinelCore(
@@ -48,7 +52,9 @@ class SentinelMiddleware:
             batch_interval=batch_interval,
             ignore_paths=ignore_paths,
             sensitive_headers=sensitive_headers,
-            sensitive_params=sensitive_params
+            sensitive_params=sensitive_params,
+            compress=compress,
+            max_queue_size=max_queue_size
         )
     
     def __call__(self, environ, start_response):
@@ -66,12 +72,12 @@ class SentinelMiddleware:
         request = Request(environ)
         
         # Record start time
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         # Capture response
         def capture_response(status, headers, exc_info=None):
             # Calculate latency
-            latency_ms = int((time.time() - start_time) * 1000)
+            latency_ms = (time.perf_counter_ns() - start_time) // 1_000_000
             
             # Parse status code
             status_code = int(status.split(" ")[0])
@@ -79,19 +85,17 @@ class SentinelMiddleware:
             # Get client IP
             ip = request.remote_addr
             if "X-Forwarded-For" in request.headers:
-                ip = request.headers["X-Forwarded-For"].split(",")[0].strip()
+                ip = request.headers["X-Forwarded-For"].partition(",")[0].strip()
             
             # Get query parameters
-            query_params = {}
-            for key, value in request.args.items():
-                query_params[key] = value
+            query_params = request.args.to_dict(flat=True)
             
             # Capture request
             self.core.capture_request(
                 method=request.method,
                 path=request.path,
                 query_params=query_params,
-                headers=dict(request.headers),
+                headers=request.headers,
                 status_code=status_code,
                 latency_ms=latency_ms,
                 ip=ip,
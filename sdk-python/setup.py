@@ -1,17 +1,24 @@
+from pathlib import Path
 from setuptools import setup, find_packages
 
+# Long description (optional, e.g. missing from some source checkouts)
+readme = Path(__file__).parent / "README.md"
+long_description = readme.read_text(encoding="utf-8") if readme.exists() else ""
+
 setup(
     name="apisentinel",
     version="1.0.0",
     packages=find_packages(),
     install_requires=[
         "requests>=2.25.0",
+        "urllib3>=1.26.0",
         "geoip2>=4.0.0",
+        "orjson>=3.6.0",
     ],
     author="API Sentinel",
     author_email="info@apisentinel.com",
     description="API Sentinel SDK for Python",
-    long_description=open("README.md").read(),
+    long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/apisentinel/sdk-python",
     classifiers=[